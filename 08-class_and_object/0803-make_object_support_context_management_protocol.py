@@ -82,3 +82,399 @@ with conn as s1:
 # 同时在12.6小节中还有一个对本节示例程序的线程安全的修改版。
 
 
+
+# 扩展：连接池
+# LazyConnection2 每次进入 with 语句都会新建一个socket，退出时再关闭它，
+# 所以每个 with 代码块都要付出一次完整的TCP握手的代价。
+# 下面的 ConnectionPool 为每个地址保存一组空闲的socket，在 with 代码块和线程之间复用它们。
+# 取出时会检查连接是否还可用，空闲太久的连接会被淘汰，并且提供命中、未命中和等待次数等统计信息。
+import threading
+from collections import deque
+from socket import MSG_PEEK
+from time import monotonic
+
+class ConnectionPool:
+    def __init__(self, maxsize=8, idle_timeout=30.0, family=AF_INET, type=SOCK_STREAM):
+        self.maxsize = maxsize
+        self.idle_timeout = idle_timeout
+        self.family = family
+        self.type = type
+        self._idle = {}     # address -> deque of (sock, last_used)
+        self._opened = {}   # address -> 已打开的socket数量(空闲的加上正在使用的)
+        self._cond = threading.Condition()
+        self.hits = 0
+        self.misses = 0
+        self.waits = 0
+        self.evictions = 0
+    @staticmethod
+    def _healthy(sock):
+        # 空闲连接上不应该有任何可读的数据，读到数据说明有残留的响应，读到空字节串说明对方已经关闭。
+        # 这里不用 select() ，因为它不能处理大于 FD_SETSIZE 的文件描述符
+        try:
+            timeout = sock.gettimeout()
+            sock.setblocking(False)
+            try:
+                sock.recv(1, MSG_PEEK)
+            except BlockingIOError:
+                return True
+            finally:
+                sock.settimeout(timeout)
+        except OSError:
+            pass
+        return False
+    def _discard(self, address, sock):
+        sock.close()
+        self._opened[address] -= 1
+        self._cond.notify()
+    def _evict(self, now):
+        # 所有地址的空闲连接都要检查，否则不再访问的地址上的连接永远不会被淘汰；
+        # 最久未使用的连接在队列左端，所以每个地址只需要看几个元素
+        for address, idle in self._idle.items():
+            while idle and now - idle[0][1] > self.idle_timeout:
+                sock, _ = idle.popleft()
+                self._discard(address, sock)
+                self.evictions += 1
+    def acquire(self, address, timeout=None):
+        deadline = None if timeout is None else monotonic() + timeout
+        with self._cond:
+            while True:
+                self._evict(monotonic())
+                idle = self._idle.get(address)
+                while idle:
+                    sock, _ = idle.pop()
+                    if self._healthy(sock):
+                        self.hits += 1
+                        return sock
+                    self._discard(address, sock)
+                if self._opened.get(address, 0) < self.maxsize:
+                    self._opened[address] = self._opened.get(address, 0) + 1
+                    self.misses += 1
+                    break
+                self.waits += 1
+                remaining = None if deadline is None else deadline - monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError('No connection available for {}'.format(address))
+                self._cond.wait(remaining)
+        # 在锁外面建立连接，不阻塞其他线程
+        try:
+            sock = socket(self.family, self.type)
+            sock.connect(address)
+        except BaseException:
+            with self._cond:
+                self._opened[address] -= 1
+                self._cond.notify()
+            raise
+        return sock
+    def release(self, address, sock, discard=False):
+        with self._cond:
+            if discard:
+                self._discard(address, sock)
+            else:
+                self._idle.setdefault(address, deque()).append((sock, monotonic()))
+                self._cond.notify()
+    def clear(self):
+        with self._cond:
+            for address, idle in self._idle.items():
+                while idle:
+                    self._discard(address, idle.pop()[0])
+    def stats(self):
+        with self._cond:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'waits': self.waits,
+                'evictions': self.evictions,
+                'idle': sum(len(idle) for idle in self._idle.values()),
+                'opened': sum(self._opened.values()),
+            }
+
+default_pool = ConnectionPool()
+
+class PooledConnection:
+    """
+    和 LazyConnection2 一样支持嵌套，不过socket是从连接池中借来的。
+    同一个线程中嵌套的层数超过连接池的 maxsize 时，内层会一直等待外层释放连接，
+    指定 timeout 可以让它抛出 TimeoutError 而不是死锁
+    """
+    def __init__(self, address, pool=None, timeout=None):
+        self.address = address
+        self.pool = pool if pool is not None else default_pool
+        self.timeout = timeout
+        # 每个线程单独维护一个栈，这样同一个对象可以在多个线程中使用
+        self._local = threading.local()
+    def __enter__(self):
+        sock = self.pool.acquire(self.address, self.timeout)
+        self._local.__dict__.setdefault('connections', []).append(sock)
+        return sock
+    def __exit__(self, exc_ty, exc_val, tb):
+        sock = self._local.connections.pop()
+        # 如果 with 代码块中出现了异常，连接的状态就不确定了，不再放回池中
+        self.pool.release(self.address, sock, discard=exc_ty is not None)
+
+# 要注意的是，连接被复用后就不能再像前面那样用"读到对方关闭连接为止"的方式来接收响应了，
+# 协议本身必须能划分出每一个请求和响应。下面用一个本地的回显服务器来演示：
+from socket import SOL_SOCKET, SO_REUSEADDR
+
+def echo_server(listener):
+    def handle(client):
+        with client:
+            for line in client.makefile('rb'):
+                client.sendall(line)
+    while True:
+        try:
+            client, _ = listener.accept()
+        except OSError:
+            break
+        threading.Thread(target=handle, args=(client,), daemon=True).start()
+
+listener = socket(AF_INET, SOCK_STREAM)
+listener.setsockopt(SOL_SOCKET, SO_REUSEADDR, 1)
+listener.bind(('127.0.0.1', 0))
+listener.listen(64)
+threading.Thread(target=echo_server, args=(listener,), daemon=True).start()
+address = listener.getsockname()
+
+def echo(conn, msg):
+    with conn as s:
+        s.sendall(msg + b'\n')
+        return s.recv(8192)
+
+pool = ConnectionPool(maxsize=4)
+conn = PooledConnection(address, pool)
+print(echo(conn, b'hello'))
+print(echo(conn, b'world'))
+with conn as s1:
+    with conn as s2:
+        # s1 and s2 are independent sockets
+        print(s1 is s2)
+print(pool.stats())
+
+# 多个线程共享同一个连接池，最多只会打开 maxsize 个连接：
+threads = [threading.Thread(target=lambda: [echo(conn, b'ping') for _ in range(50)]) for _ in range(16)]
+for t in threads:
+    t.start()
+for t in threads:
+    t.join()
+print(pool.stats())
+
+# 和每次都新建连接的 LazyConnection2 比较一下：
+import time
+
+def bench(n=2000):
+    start = time.perf_counter()
+    conn = LazyConnection2(address)
+    for _ in range(n):
+        echo(conn, b'ping')
+    print('LazyConnection2: {:.0f} requests/s'.format(n / (time.perf_counter() - start)))
+    start = time.perf_counter()
+    pool = ConnectionPool()
+    conn = PooledConnection(address, pool)
+    for _ in range(n):
+        echo(conn, b'ping')
+    print('PooledConnection: {:.0f} requests/s'.format(n / (time.perf_counter() - start)))
+    pool.clear()
+
+bench()
+pool.clear()
+listener.close()
+
+# 扩展：异步版本的 LazyConnection
+# 上面的实现都是阻塞的，每个连接在读取响应时都要占用一个线程。
+# 使用 asyncio 的话，只需要实现 __aenter__() 和 __aexit__() 方法就可以支持 async with 语句了。
+# 下面的 AsyncLazyConnection 同样在初始化时什么都不做，并且和 LazyConnection2 一样用一个栈来支持嵌套。
+import asyncio
+
+class AsyncStream:
+    """async with 返回的连接对象，可以用 async for 分块读取响应"""
+    def __init__(self, reader, writer, bufsize=8192):
+        self.reader = reader
+        self.writer = writer
+        self.bufsize = bufsize
+    async def send(self, data):
+        self.writer.write(data)
+        await self.writer.drain()
+    def write_eof(self):
+        self.writer.write_eof()
+    def __aiter__(self):
+        return self
+    async def __anext__(self):
+        chunk = await self.reader.read(self.bufsize)
+        if not chunk:
+            raise StopAsyncIteration
+        return chunk
+    async def read_all(self):
+        return b''.join([chunk async for chunk in self])
+
+class AsyncLazyConnection:
+    def __init__(self, address, bufsize=8192):
+        self.address = address
+        self.bufsize = bufsize
+        self.connections = []
+    async def __aenter__(self):
+        reader, writer = await asyncio.open_connection(*self.address)
+        stream = AsyncStream(reader, writer, self.bufsize)
+        self.connections.append(stream)
+        return stream
+    async def __aexit__(self, exc_ty, exc_val, tb):
+        writer = self.connections.pop().writer
+        writer.close()
+        await writer.wait_closed()
+    def __aiter__(self):
+        # async for chunk in conn 读取的是最内层的那个连接
+        if not self.connections:
+            raise RuntimeError('Not connected')
+        return self.connections[-1]
+
+# 和 www.python.org 的例子一样，使用方式如下：
+# conn = AsyncLazyConnection(('www.python.org', 80))
+# async with conn as s:
+#     await s.send(b'GET /index.html HTTP/1.0\r\nHost: www.python.org\r\n\r\n')
+#     resp = b''.join([chunk async for chunk in conn])
+
+# 下面用一个本地的asyncio服务器来对比1000个并发请求时异步版本和线程版本的表现。
+# 服务器读到客户端的EOF以后返回一段固定的响应，然后关闭连接，就像HTTP/1.0那样。
+from concurrent.futures import ThreadPoolExecutor
+
+RESPONSE = b'x' * 65536
+
+async def handle_request(reader, writer):
+    await reader.read()
+    writer.write(RESPONSE)
+    await writer.drain()
+    writer.close()
+
+def start_server_thread():
+    loop = asyncio.new_event_loop()
+    server = loop.run_until_complete(
+        asyncio.start_server(handle_request, '127.0.0.1', 0, backlog=2048))
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return loop, server, server.sockets[0].getsockname()
+
+async def async_request(address):
+    conn = AsyncLazyConnection(address)
+    async with conn as s:
+        await s.send(b'GET / HTTP/1.0\r\n\r\n')
+        s.write_eof()
+        return b''.join([chunk async for chunk in conn])
+
+def threaded_request(address):
+    with LazyConnection2(address) as s:
+        s.sendall(b'GET / HTTP/1.0\r\n\r\n')
+        s.shutdown(1)
+        return b''.join(iter(partial(s.recv, 8192), b''))
+
+def bench(n=1000, workers=100):
+    loop, server, address = start_server_thread()
+
+    async def fan_out():
+        return await asyncio.gather(*[async_request(address) for _ in range(n)])
+
+    start = time.perf_counter()
+    results = asyncio.run(fan_out())
+    assert all(r == RESPONSE for r in results)
+    print('AsyncLazyConnection: {} requests {:.3f}s'.format(n, time.perf_counter() - start))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(workers) as pool:
+        results = list(pool.map(threaded_request, [address] * n))
+    assert all(r == RESPONSE for r in results)
+    print('LazyConnection2 ({} threads): {} requests {:.3f}s'.format(
+        workers, n, time.perf_counter() - start))
+
+    loop.call_soon_threadsafe(server.close)
+    loop.call_soon_threadsafe(loop.stop)
+
+bench()
+# 由于服务器和客户端在同一个进程里共享GIL，两者的总耗时差不多。
+# 但异步版本只用一个线程就同时处理了所有连接，而线程版本的并发数受限于线程池的大小，
+# 每个线程还要占用自己的栈空间。注意同时打开1000个连接需要足够大的文件描述符限制(ulimit -n)。
+
+# 扩展：零拷贝地读取响应
+# 前面读取响应用的是 b''.join(iter(partial(s.recv, 8192), b''))，
+# 每次 recv() 都会分配一个新的bytes对象，最后 join() 的时候还要把所有数据再复制一遍。
+# 对于几MB的响应，更好的办法是使用 recv_into() 直接把数据读到一个预先分配好的 bytearray 中，
+# 空间不够时按倍数扩容，最后返回一个 memoryview 而不是再复制成bytes。
+def recv_all(sock, sizehint=65536):
+    """读取直到对方关闭连接，返回一个 memoryview。如果知道响应大小(比如Content-Length)，
+    可以通过sizehint传进来，这样就不需要扩容了"""
+    # 多预留一个字节，这样刚好读满时不会为了读到EOF而扩容
+    buf = bytearray(sizehint + 1)
+    size = 0
+    while True:
+        if size == len(buf):
+            # 容量翻倍(原地扩展，不会分配临时对象)，均摊下来每个字节只会被复制常数次
+            buf *= 2
+        with memoryview(buf) as view:
+            n = sock.recv_into(view[size:])
+        if n == 0:
+            break
+        size += n
+    return memoryview(buf)[:size]
+
+def recv_to_file(sock, f, bufsize=65536):
+    """把响应直接写入一个文件，始终复用同一个缓冲区，返回写入的字节数"""
+    buf = bytearray(bufsize)
+    total = 0
+    with memoryview(buf) as view:
+        while True:
+            n = sock.recv_into(view)
+            if n == 0:
+                break
+            f.write(view[:n])
+            total += n
+    return total
+
+# os.sendfile() 只能从文件发送到socket，反方向(socket到文件)在Linux上并不支持，
+# 所以 recv_to_file() 只是避免了中间的bytes对象，数据还是会经过一次用户空间的缓冲区。
+
+# 下面比较一下两种方式读取一个大响应时的吞吐量和内存峰值：
+import tempfile
+import tracemalloc
+
+def serve_payload(listener, payload):
+    while True:
+        try:
+            client, _ = listener.accept()
+        except OSError:
+            break
+        with client:
+            client.sendall(payload)
+
+def bench(size=32 * 2**20, repeat=5):
+    listener = socket(AF_INET, SOCK_STREAM)
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(8)
+    payload = b'x' * size
+    threading.Thread(target=serve_payload, args=(listener, payload), daemon=True).start()
+    address = listener.getsockname()
+
+    def join_recv(s):
+        return b''.join(iter(partial(s.recv, 8192), b''))
+    def to_file(s):
+        with tempfile.TemporaryFile() as f:
+            return recv_to_file(s, f)
+
+    def run(read):
+        with LazyConnection2(address) as s:
+            data = read(s)
+        assert (data if isinstance(data, int) else len(data)) == size
+
+    for label, read in [('join', join_recv), ('recv_all', recv_all), ('recv_to_file', to_file)]:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            run(read)
+        elapsed = time.perf_counter() - start
+        # tracemalloc 本身会拖慢分配，所以单独跑一次来统计内存峰值
+        tracemalloc.start()
+        run(read)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print('{:>12}: {:.0f} MB/s, peak {:.1f} MB'.format(
+            label, size * repeat / elapsed / 2**20, peak / 2**20))
+    listener.close()
+
+bench()
+# 使用 join 的方式峰值内存大约是响应大小的两倍(所有分块加上最终结果)，
+# recv_all() 最坏情况下也是两倍(最后一次扩容)，传入准确的sizehint时就只有响应大小本身，
+# 而 recv_to_file() 只需要一个固定大小的缓冲区。
+# 这里的内存峰值是通过 tracemalloc 统计的Python分配，而不是整个进程的RSS。
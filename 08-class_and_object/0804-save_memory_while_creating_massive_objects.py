@@ -40,4 +40,161 @@ print(sys.getsizeof(d), sys.getsizeof(d2))
 # (比如在程序中需要创建某个类的几百万个实例对象)。
 
 # 关于 __slots__ 的一个常见误区是它可以作为一个封装工具来防止用户给实例增加新的属性。 
-# 尽管使用slots可以达到这样的目的，但是这个并不是它的初衷。 __slots__ 更多的是用来作为一个内存优化工具。
\ No newline at end of file
+# 尽管使用slots可以达到这样的目的，但是这个并不是它的初衷。 __slots__ 更多的是用来作为一个内存优化工具。
+
+# 扩展：按列存储(struct-of-arrays)
+# 即使用了 __slots__ ，每个实例仍然是一个完整的Python对象，外加三个装箱的int。
+# 如果要同时保存上千万个日期，更省内存的做法是干脆不创建实例，
+# 而是把 __slots__ 中的每个字段分别放到一个 array.array 里面，按下标取出一行。
+# 下标访问时只返回一个很轻量的视图对象(flyweight)，它本身只保存表和下标两个引用。
+from array import array
+from itertools import compress
+
+def _slot_names(cls):
+    # __slots__ 可以是单个字符串，基类中定义的slots也要算上
+    names = []
+    for klass in cls.__mro__:
+        slots = klass.__dict__.get('__slots__', ())
+        names.extend([slots] if isinstance(slots, str) else slots)
+    return tuple(name for name in names if name not in ('__dict__', '__weakref__'))
+
+def _make_view(cls, fields):
+    """为某个类生成对应的行视图类，每个字段都是一个读写列数据的property"""
+    def make_property(i):
+        def getter(self):
+            return self._columns[i][self._index]
+        def setter(self, value):
+            self._columns[i][self._index] = value
+        return property(getter, setter)
+
+    def __repr__(self):
+        return '{}View({})'.format(cls.__name__,
+                ', '.join(repr(getattr(self, name)) for name in fields))
+
+    ns = {'__slots__': ('_columns', '_index'), '__repr__': __repr__}
+    for i, name in enumerate(fields):
+        ns[name] = make_property(i)
+    return type(cls.__name__ + 'View', (), ns)
+
+class SlotTable:
+    """将某个 __slots__ 类的所有实例按列存储在 array.array 中"""
+    typecodes = {}
+    def __init__(self, cls, typecodes=None):
+        self.cls = cls
+        self.fields = _slot_names(cls)
+        codes = dict(self.typecodes, **(typecodes or {}))
+        self._codes = tuple(codes.get(name, 'q') for name in self.fields)
+        self._columns = tuple(array(code) for code in self._codes)
+        self._view = _make_view(cls, self.fields)
+    def __len__(self):
+        return len(self._columns[0])
+    def __iter__(self):
+        view = self._view
+        for i in range(len(self)):
+            row = view.__new__(view)
+            row._columns = self._columns
+            row._index = i
+            yield row
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            table = self._empty()
+            for src, dst in zip(self._columns, table._columns):
+                dst.extend(src[index])
+            return table
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('SlotTable index out of range')
+        row = self._view.__new__(self._view)
+        row._columns = self._columns
+        row._index = index
+        return row
+    def _empty(self):
+        table = self.__class__.__new__(self.__class__)
+        table.cls = self.cls
+        table.fields = self.fields
+        table._codes = self._codes
+        table._columns = tuple(array(code) for code in self._codes)
+        table._view = self._view
+        return table
+    def column(self, name):
+        return self._columns[self.fields.index(name)]
+    def _extend(self, cols):
+        # 先在临时数组中完成类型转换，溢出或者类型错误会在修改任何一列之前抛出，
+        # 这样各列的长度始终保持一致
+        if len(cols) != len(self.fields):
+            raise TypeError('expected {} columns, got {}'.format(len(self.fields), len(cols)))
+        arrays = [array(code, values) for code, values in zip(self._codes, cols)]
+        if len(set(map(len, arrays))) > 1:
+            raise ValueError('columns have different lengths')
+        for col, values in zip(self._columns, arrays):
+            col.extend(values)
+    def append(self, *values):
+        self._extend([(value,) for value in values])
+    def extend(self, rows):
+        # 先转置成列再整块 extend，避免每个值都走一次 append
+        rows = list(rows)
+        if rows:
+            try:
+                cols = list(zip(*rows, strict=True))
+            except ValueError:
+                raise ValueError('rows have different lengths') from None
+            self._extend(cols)
+    def extend_columns(self, **columns):
+        self._extend([columns[name] for name in self.fields])
+    def where(self, name, pred):
+        """按某一列过滤，返回一个新表，过程中不会创建任何行对象"""
+        mask = list(map(pred, self.column(name)))
+        table = self._empty()
+        for src, dst in zip(self._columns, table._columns):
+            dst.extend(compress(src, mask))
+        return table
+    def to_object(self, index):
+        """还原成一个真正的 cls 实例"""
+        obj = self.cls.__new__(self.cls)
+        for name, col in zip(self.fields, self._columns):
+            setattr(obj, name, col[index])
+        return obj
+    def nbytes(self):
+        return sum(col.itemsize * len(col) for col in self._columns)
+
+class DateColumn(SlotTable):
+    # year用2个字节，month和day各1个字节，每行只占5个字节
+    typecodes = {'year': 'H', 'month': 'B', 'day': 'B'}
+    def __init__(self):
+        super().__init__(Date)
+
+dates = DateColumn()
+dates.append(2023, 6, 11)
+dates.extend([(2023, 6, 12), (2024, 1, 1), (2024, 2, 29)])
+print(len(dates), dates[0], dates[-1])
+print(list(dates.where('year', lambda y: y >= 2024)))
+print(dates[1:3].to_object(0).day)
+
+# 下面是一个简单的内存/速度对比，n可以调整为 10**6 或 10**7 来观察大规模时的效果：
+import time
+import tracemalloc
+
+def bench(n):
+    rows = [(2000 + i % 50, 1 + i % 12, 1 + i % 28) for i in range(n)]
+    def build_date():
+        return [Date(*row) for row in rows]
+    def build_date2():
+        return [Date2(*row) for row in rows]
+    def build_column():
+        table = DateColumn()
+        table.extend(rows)
+        return table
+    for label, build in [('Date2', build_date2), ('Date', build_date), ('DateColumn', build_column)]:
+        tracemalloc.start()
+        start = time.perf_counter()
+        result = build()
+        elapsed = time.perf_counter() - start
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del result
+        print('{:>10}: n={} {:.3f}s {:.1f}MB'.format(label, n, elapsed, size / 2**20))
+
+bench(10**5)
+# 在64位的Python上 DateColumn 的内存大约只有 Date 的几十分之一，
+# 代价是每次访问字段都要经过一次property，更适合批量扫描而不是频繁的单行访问。
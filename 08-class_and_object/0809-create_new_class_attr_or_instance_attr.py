@@ -67,11 +67,16 @@ class Integer:
 # __get__() 看上去有点复杂的原因归结于实例变量和类变量的不同。 
 # 如果一个描述器被当做一个类变量来访问，那么 instance 参数被设置成 None 。 
 # 这种情况下，标准做法就是简单的返回这个描述器本身即可(尽管你还可以添加其他的自定义操作)。例如：
-p = Point(2,3)
-# Calls Point.x.__get__(p, Point)
-print(p.x)
-# Calls Point.x.__get__(None, Point)
-print(Point.x)
+try:
+    # 上面的 Point 并不能工作，这里的 Integer 也没有接受 name 参数的 __init__()
+    # TypeError: Integer() takes no arguments
+    p = Point(2,3)
+    # Calls Point.x.__get__(p, Point)
+    print(p.x)
+    # Calls Point.x.__get__(None, Point)
+    print(Point.x)
+except TypeError as e:
+    print(e)
 
 # 描述器通常是那些使用到装饰器或元类的大型框架中的一个组件。
 # 同时它们的使用也被隐藏在后面。 
@@ -109,6 +114,93 @@ class Stock:
         self.shares = shares
         self.price = price
 
+# 扩展：为 typeassert 生成专用的 __init__
+# 上面的 Stock 每构造一次都要经过三次 Typed.__set__() 调用，每次调用又要做 isinstance 检查
+# 和实例字典的查找。对于需要大量创建实例的场景，可以在类装饰时直接用代码生成一个 __init__ ，
+# 一次性检查所有参数，再把值直接写入 __slots__ ，完全绕过描述器。
+# 描述器依然保留在类上，之后对属性的修改仍然会做类型检查。
+class SlotTyped(Typed):
+    """把值存储在一个 __slots__ 成员中的类型检查描述器"""
+    def __init__(self, name, expected_type, storage):
+        super().__init__(name, expected_type)
+        self.storage = storage
+    def __get__(self, instance, cls):
+        if instance is None:
+            return self
+        return getattr(instance, self.storage)
+    def __set__(self, instance, value):
+        if not isinstance(value, self.expected_type):
+            raise TypeError('Expected ' + str(self.expected_type))
+        setattr(instance, self.storage, value)
+    def __delete__(self, instance):
+        delattr(instance, self.storage)
+
+def _make_init(fields):
+    """生成形如 __init__(self, name, shares, price) 的构造函数"""
+    args = ', '.join(fields)
+    lines = ['def __init__(self, {}):'.format(args)]
+    for name in fields:
+        lines.append('    if not isinstance({0}, _t_{0}):'.format(name))
+        lines.append('        raise TypeError(_msg_{0})'.format(name))
+    for name in fields:
+        lines.append('    self._{0} = {0}'.format(name))
+    return '\n'.join(lines)
+
+def typeassert(fastinit=False, **kwargs):
+    def decorate(cls):
+        if not fastinit:
+            for name, expected_type in kwargs.items():
+                setattr(cls, name, Typed(name, expected_type))
+            return cls
+        # __slots__ 只能在类创建时指定，所以这里生成一个同名的子类
+        fields = tuple(kwargs)
+        ns = {
+            '__slots__': tuple('_' + name for name in fields),
+            '__module__': cls.__module__,
+            '__qualname__': cls.__qualname__,
+            '__doc__': cls.__doc__,
+        }
+        env = {}
+        for name, expected_type in kwargs.items():
+            ns[name] = SlotTyped(name, expected_type, '_' + name)
+            env['_t_' + name] = expected_type
+            env['_msg_' + name] = 'Expected ' + str(expected_type)
+        exec(_make_init(fields), env)
+        ns['__init__'] = env['__init__']
+        ns['__init__'].__qualname__ = cls.__qualname__ + '.__init__'
+        return type(cls)(cls.__name__, (cls,), ns)
+    return decorate
+
+@typeassert(fastinit=True, name=str, shares=int, price=float)
+class FastStock:
+    # 定义空的 __slots__ ，这样生成的子类就完全没有实例字典了
+    __slots__ = ()
+
+s = FastStock('ACME', 50, 91.1)
+print(s.name, s.shares, s.price)
+s.shares = 75
+try:
+    s.shares = '75'
+except TypeError as e:
+    print(e)
+try:
+    FastStock('ACME', 50, 91)
+except TypeError as e:
+    print(e)
+
+# 对比一下两种方式的构造速度：
+from timeit import timeit
+
+def bench(number=10**6):
+    for cls in (Stock, FastStock):
+        t = timeit("cls('ACME', 50, 91.1)", globals={'cls': cls}, number=number)
+        print('{:>9}: {:.0f} objects/s'.format(cls.__name__, number / t))
+
+bench()
+# 生成的 __init__ 只是普通的Python代码，但省掉了每个属性一次的描述器调用，
+# 构造速度一般能提升2倍以上。代价是它会忽略原来类中定义的 __init__ ，
+# 参数的顺序就是传给 typeassert 的关键字参数的顺序。
+
 # 最后要指出的一点是，如果你只是想简单的自定义某个类的单个属性访问的话就不用去写描述器了。
 # 这种情况下使用8.6小节介绍的property技术会更加容易。 
 # 当程序中有很多重复代码的时候描述器就很有用了 
@@ -93,8 +93,229 @@ class Circle:
     
 c = Circle(6.0)
 print(c.area)
-# AttributeError: can't set attribute
-c.area = 35
+try:
+    # AttributeError: can't set attribute
+    c.area = 35
+except AttributeError as e:
+    print(e)
 # 然而，这种方案有一个缺点就是所有get操作都必须被定向到属性的 getter 函数上去。 
 # 这个跟之前简单的在实例字典中查找值的方案相比效率要低一点。
 # 如果想获取更多关于property和可管理属性的信息，可以参考8.6小节。而描述器的相关内容可以在8.9小节找到。
+
+# 扩展：带依赖失效、TTL并且线程安全的延迟属性
+# 上面的 lazyproperty 一旦计算出来就永远不会更新。但如果 Circle.radius 被修改了，
+# 缓存的 area 就变成了错误的值。另外在多线程环境下，多个线程同时首次访问时计算可能会被执行多次。
+# 下面的 cachedproperty 可以声明依赖的属性，在依赖属性被赋值时自动让缓存失效，
+# 同时支持可选的过期时间(ttl)，并保证并发首次访问时只计算一次。
+import threading
+from functools import partial
+from time import monotonic
+
+class _Dependency:
+    """被依赖的属性，赋值时让所有依赖它的缓存失效"""
+    def __init__(self, name):
+        self.name = name
+        self.dependents = []
+    def __get__(self, instance, cls):
+        if instance is None:
+            return self
+        try:
+            return instance.__dict__[self.name]
+        except KeyError:
+            raise AttributeError(self.name) from None
+    def __set__(self, instance, value):
+        instance.__dict__[self.name] = value
+        for prop in self.dependents:
+            prop.invalidate(instance)
+    def __delete__(self, instance):
+        del instance.__dict__[self.name]
+        for prop in self.dependents:
+            prop.invalidate(instance)
+
+class _CachedProperty:
+    def __init__(self, func, depends=(), ttl=None):
+        self.func = func
+        self.name = func.__name__
+        self.depends = tuple(depends)
+        self.ttl = ttl
+        # 有ttl时值和过期时间一起保存在另外一个键里，每次访问都要检查是否过期
+        self.key = self.name if ttl is None else '_cached_' + self.name
+        # 锁保存在每个实例自己的字典中，一个对象上很慢的计算不会阻塞其他对象
+        self.lockkey = '_lock_' + self.name
+        self.__doc__ = func.__doc__
+    def __set_name__(self, owner, name):
+        self.name = name
+        self.lockkey = '_lock_' + name
+        if self.ttl is None:
+            self.key = name
+        for dep in self.depends:
+            # 沿着MRO查找，依赖的属性可能是从基类继承下来的
+            attr = next((c.__dict__[dep] for c in owner.__mro__ if dep in c.__dict__), None)
+            if attr is None:
+                attr = _Dependency(dep)
+                setattr(owner, dep, attr)
+            elif not isinstance(attr, _Dependency):
+                raise TypeError('Cannot track dependency {!r} on {}'.format(dep, owner.__name__))
+            elif dep not in owner.__dict__:
+                # 基类的 _Dependency 不能直接修改，否则基类的其他子类也会受影响。
+                # 在子类中放一个副本，同时带上基类已有的依赖项
+                inherited = attr
+                attr = _Dependency(dep)
+                attr.dependents.extend(inherited.dependents)
+                setattr(owner, dep, attr)
+            attr.dependents.append(self)
+    def __get__(self, instance, cls):
+        if instance is None:
+            return self
+        d = instance.__dict__
+        # 没有ttl时和 lazyproperty 一样，值直接放在实例字典的同名键中，
+        # 命中时根本不会调用到这里(非数据描述器的优先级低于实例字典)
+        if self.ttl is not None:
+            entry = d.get(self.key)
+            if entry is not None and entry[1] > monotonic():
+                return entry[0]
+        # setdefault() 是原子操作，并发时所有线程拿到的都是同一把锁
+        lock = d.get(self.lockkey) or d.setdefault(self.lockkey, threading.RLock())
+        with lock:
+            # 拿到锁以后再检查一次，其他线程可能已经算好了
+            if self.ttl is None:
+                if self.key in d:
+                    return d[self.key]
+                value = d[self.key] = self.func(instance)
+            else:
+                entry = d.get(self.key)
+                if entry is not None and entry[1] > monotonic():
+                    return entry[0]
+                value = self.func(instance)
+                d[self.key] = (value, monotonic() + self.ttl)
+            return value
+    def invalidate(self, instance):
+        d = instance.__dict__
+        lock = d.get(self.lockkey)
+        if lock is None:
+            # 从来没有计算过，也就不会有正在进行的计算
+            d.pop(self.key, None)
+        else:
+            # 等正在进行的计算结束以后再清除，否则它可能会把用旧的依赖算出来的值写回去
+            with lock:
+                d.pop(self.key, None)
+
+def cachedproperty(func=None, *, depends=(), ttl=None):
+    if func is None:
+        return partial(cachedproperty, depends=depends, ttl=ttl)
+    return _CachedProperty(func, depends, ttl)
+
+class Circle:
+    def __init__(self, radius) -> None:
+        self.radius = radius
+    @cachedproperty(depends=['radius'])
+    def area(self):
+        print('Computing area')
+        return math.pi * self.radius ** 2
+    @cachedproperty(depends=['radius'], ttl=60)
+    def perimeter(self):
+        print('Computing perimeter')
+        return 2 * math.pi * self.radius
+
+c = Circle(4.0)
+print(c.area)
+print(c.area)
+# 修改半径后缓存自动失效，会重新计算
+c.radius = 5.0
+print(c.area)
+print(c.perimeter)
+print(c.perimeter)
+
+# 子类中新增的依赖不会覆盖基类的依赖，修改半径后基类和子类的缓存都会失效
+class Ring(Circle):
+    @cachedproperty(depends=['radius'])
+    def diameter(self):
+        print('Computing diameter')
+        return 2 * self.radius
+
+r = Ring(1.0)
+print(r.area, r.diameter)
+r.radius = 10.0
+print(r.area, r.diameter)
+
+# 依赖的属性已经是其他描述器(比如property)时无法跟踪赋值，直接报错。
+# 注意 __set_name__ 中的异常在Python 3.12之前会被包装成 RuntimeError
+class Square:
+    @property
+    def side(self):
+        return 2.0
+
+try:
+    class Cube(Square):
+        @cachedproperty(depends=['side'])
+        def volume(self):
+            return self.side ** 3
+except (TypeError, RuntimeError) as e:
+    print(repr(e.__cause__ or e))
+
+# 并发首次访问时只会计算一次
+import time
+
+class Slow:
+    calls = 0
+    @cachedproperty
+    def value(self):
+        Slow.calls += 1
+        time.sleep(0.01)
+        return 42
+
+s = Slow()
+threads = [threading.Thread(target=lambda: s.value) for _ in range(8)]
+for t in threads:
+    t.start()
+for t in threads:
+    t.join()
+print('computed', Slow.calls, 'time(s)')
+
+# 下面比较一下命中缓存时的访问开销：
+from timeit import timeit
+
+class dictlazyproperty:
+    """本节最开始的实现，值直接覆盖在实例字典中"""
+    def __init__(self, func):
+        self.func = func
+    def __get__(self, instance, cls):
+        if instance is None:
+            return self
+        value = self.func(instance)
+        setattr(instance, self.func.__name__, value)
+        return value
+
+def bench(number=10**6):
+    class Plain:
+        radius = 4.0
+        @dictlazyproperty
+        def area(self):
+            return math.pi * self.radius ** 2
+    class ReadOnly:
+        radius = 4.0
+        @lazyproperty
+        def area(self):
+            return math.pi * self.radius ** 2
+    class Tracked:
+        def __init__(self):
+            self.radius = 4.0
+        @cachedproperty(depends=['radius'])
+        def area(self):
+            return math.pi * self.radius ** 2
+    class Expiring:
+        radius = 4.0
+        @cachedproperty(ttl=60)
+        def area(self):
+            return math.pi * self.radius ** 2
+    for cls in (Plain, ReadOnly, Tracked, Expiring):
+        obj = cls()
+        obj.area
+        t = timeit('obj.area', globals={'obj': obj}, number=number)
+        print('{:>8}: {:.1f} ns/access'.format(cls.__name__, t / number * 1e9))
+
+bench()
+# 不带ttl时命中路径就是一次实例字典查找，和最开始的 lazyproperty 基本一样快；
+# 带ttl时每次访问都要调用 __get__() 并读取时钟，开销比只读版本的 lazyproperty 还要大一些，
+# 所以只在确实需要过期时间的属性上使用它。
+# 依赖属性本身变成了一个数据描述器，所以对 radius 的读写会稍慢一些。
@@ -161,3 +161,620 @@ class ListLike:
         del self._items[idx]
         
 # 11.8小节还有一个在远程方法调用环境中使用代理的例子。
+
+# 扩展：为目标类生成专用的代理类
+# 上面的 Proxy 每次访问属性都要先查找失败，再进入 Python 写的 __getattr__ ，
+# 每次赋值也都要经过 __setattr__ 里的 startswith('_') 判断，比直接访问慢了一个数量级。
+# 另外正如 ListLike 所示，__len__ 、__getitem__ 这类特殊方法根本不会经过 __getattr__ 。
+# 下面的 make_proxy() 只在第一次使用时检查一遍目标类，然后生成一个真正的代理类：
+# 每个公共属性和方法都是一个 property ，getter 直接使用 operator.attrgetter('_obj.name') (C语言实现)，
+# 方法返回的就是被代理对象的绑定方法，调用时不会多出一层 Python 函数；
+# 特殊方法则用 exec 生成转发函数，生成的类按照目标类缓存起来。
+import inspect
+from operator import attrgetter
+
+# 这些特殊方法和代理对象本身相关，不能转发
+_NOT_FORWARDED = {
+    '__init__', '__new__', '__del__', '__getattribute__', '__getattr__', '__setattr__', '__delattr__',
+    '__init_subclass__', '__subclasshook__', '__class_getitem__', '__set_name__', '__dir__',
+    '__dict__', '__weakref__', '__slots__', '__module__', '__qualname__', '__doc__', '__annotations__',
+    '__reduce__', '__reduce_ex__', '__getstate__', '__setstate__', '__sizeof__', '__class__',
+    '__get__', '__set__', '__delete__',
+}
+
+_proxy_classes = {}
+
+def _dunder_params(func):
+    """返回方法除self以外的位置参数个数，不是固定个数的位置参数时返回None"""
+    try:
+        params = list(inspect.signature(func).parameters.values())[1:]
+    except (TypeError, ValueError):
+        return None
+    for p in params:
+        if p.kind not in (p.POSITIONAL_ONLY, p.POSITIONAL_OR_KEYWORD) or p.default is not p.empty:
+            return None
+    return len(params)
+
+def _make_forwards(public, methods, target='self._obj'):
+    lines = []
+    for name in public:
+        lines += [
+            'def _set_{}(self, value):'.format(name),
+            '    {}.{} = value'.format(target, name),
+            'def _del_{}(self):'.format(name),
+            '    del {}.{}'.format(target, name),
+        ]
+    for name, nargs in methods:
+        if nargs is None:
+            args = call = '*args, **kwargs'
+        else:
+            args = call = ', '.join('a{}'.format(i) for i in range(nargs))
+        lines.append('def {}(self, {}):'.format(name, args) if args else 'def {}(self):'.format(name))
+        if name in _EXPRESSIONS and nargs == _EXPRESSIONS[name][0]:
+            # 常用的特殊方法直接写成对应的语法，比调用 self._obj.__len__() 要快
+            lines.append('    ' + _EXPRESSIONS[name][1].format(target, *args.split(', ')))
+        elif name.startswith('__i') and name[3:-2] in _INPLACE:
+            # 就地运算返回的是被代理对象时要返回代理本身，否则 p += x 会把 p 变成被代理对象
+            lines += [
+                '    r = {}.{}({})'.format(target, name, call),
+                '    return self if r is {} else r'.format(target),
+            ]
+        else:
+            lines.append('    return {}.{}({})'.format(target, name, call))
+    return '\n'.join(lines)
+
+_EXPRESSIONS = {
+    '__len__': (0, 'return len({})'),
+    '__iter__': (0, 'return iter({})'),
+    '__contains__': (1, 'return {1} in {0}'),
+    '__getitem__': (1, 'return {}[{}]'),
+    '__setitem__': (2, '{}[{}] = {}'),
+    '__delitem__': (1, 'del {}[{}]'),
+}
+
+_INPLACE = {'add', 'sub', 'mul', 'matmul', 'truediv', 'floordiv', 'mod', 'pow',
+            'lshift', 'rshift', 'and', 'xor', 'or'}
+
+def make_proxy(cls, attrs=()):
+    """
+    生成 cls 的代理类，attrs 是需要转发的实例属性(在 __init__ 中赋值的那些，
+    类里面看不到，__slots__ 中声明的会自动加入)
+    """
+    key = (cls, tuple(attrs))
+    try:
+        return _proxy_classes[key]
+    except KeyError:
+        pass
+    public = dict.fromkeys(attrs)
+    dunders = {}
+    for klass in cls.__mro__[:-1]:
+        slots = klass.__dict__.get('__slots__', ())
+        for name in [slots] if isinstance(slots, str) else slots:
+            if not name.startswith('_'):
+                public.setdefault(name)
+        for name, value in klass.__dict__.items():
+            if name.startswith('__') and name.endswith('__'):
+                if name not in _NOT_FORWARDED and name not in dunders:
+                    dunders[name] = value
+            elif not name.startswith('_'):
+                public.setdefault(name)
+    env = {}
+    forwarded = [(name, _dunder_params(value)) for name, value in dunders.items() if value is not None]
+    exec(_make_forwards(public, forwarded), env)
+
+    def __init__(self, obj):
+        self._obj = obj
+    def __getattr__(self, name):
+        # 其他没有事先生成的属性，仍然按照原来的方式转发
+        if name == '_obj':
+            raise AttributeError(name)
+        return getattr(self._obj, name)
+    ns = {
+        '__slots__': ('_obj',),
+        '__module__': cls.__module__,
+        '__qualname__': cls.__qualname__ + 'Proxy',
+        '__doc__': 'Proxy for {}'.format(cls.__qualname__),
+        '__init__': __init__,
+        '__getattr__': __getattr__,
+    }
+    for name in public:
+        ns[name] = property(attrgetter('_obj.' + name), env['_set_' + name], env['_del_' + name])
+    for name, value in dunders.items():
+        # 比如 list.__hash__ 是 None ，代理类同样应该是不可哈希的
+        ns[name] = env[name] if value is not None else None
+    proxy_cls = _proxy_classes[key] = type(cls.__name__ + 'Proxy', (), ns)
+    return proxy_cls
+
+def fast_proxy(obj):
+    """根据实例字典中已有的属性生成代理类，然后包装 obj"""
+    return make_proxy(type(obj), tuple(getattr(obj, '__dict__', ())))(obj)
+
+# 使用演示：
+p = fast_proxy(s)
+print(type(p).__name__, p.x)
+p.bar(3)
+p.x = 37
+print(s.x, p.x)
+
+lp = make_proxy(list)([3, 1, 2])
+lp.append(0)
+lp.sort()
+lp += [4]
+lp[0] = -1
+print(type(lp).__name__, len(lp), lp[0], lp[1:3], 2 in lp, list(lp), lp)
+del lp[0]
+print(lp, sorted(reversed(lp)))
+try:
+    hash(lp)
+except TypeError as e:
+    print(e)
+
+# 对比一下属性读取、赋值、方法调用和 len() 的开销，
+# 原来的 Proxy 在 __getattr__ 中会打印日志，这里用一个去掉了 print 的子类来比较
+from timeit import timeit
+
+class QuietProxy(Proxy):
+    def __getattr__(self, name):
+        return getattr(self._obj, name)
+    def __setattr__(self, name, value):
+        if name.startswith('_'):
+            super().__setattr__(name, value)
+        else:
+            setattr(self._obj, name, value)
+    def __len__(self):
+        return len(self._obj)
+
+class Account:
+    def __init__(self, owner, balance):
+        self.owner = owner
+        self.balance = balance
+    def deposit(self, amount):
+        self.balance += amount
+    def __len__(self):
+        return self.balance
+
+def bench(number=10**6):
+    direct = Account('Guido', 0)
+    candidates = [
+        ('direct', direct),
+        ('Proxy', QuietProxy(Account('Guido', 0))),
+        ('make_proxy', fast_proxy(Account('Guido', 0))),
+    ]
+    for label, obj in candidates:
+        env = {'obj': obj}
+        get = timeit('obj.balance', globals=env, number=number)
+        set_ = timeit('obj.balance = 1', globals=env, number=number)
+        call = timeit('obj.deposit(1)', globals=env, number=number)
+        length = timeit('len(obj)', globals=env, number=number)
+        print('{:>10}: get {:.3f}s, set {:.3f}s, call {:.3f}s, len {:.3f}s'.format(
+            label, get, set_, call, length))
+
+bench()
+# 生成的代理类上属性读取快了将近10倍，方法调用也快了2倍多，它们只比直接访问多了一次C语言层面的 getattr ；
+# 赋值省掉了 startswith() 的判断，但仍然要经过一个Python函数。
+# len() 和手写的 __len__ 一样都是一层Python函数，没有什么可省的(保留 __getattr__ 作为后备会让它稍慢一点)，
+# 生成的好处在于不用再一个个手写。
+# 需要注意的是，生成的代理类使用了 __slots__ ，所以不能给代理对象设置没有事先声明的属性。
+
+# 扩展：批量获取属性的远程代理
+# 远程代理(11.8小节)的每一次属性访问和方法调用都是一次网络往返，往返的延迟通常远大于调用本身的开销。
+# 下面的 RemoteProxy 通过 multiprocessing.connection 和服务端通信，每个请求带一个编号，
+# 由一个后台线程接收响应并交给对应的 Future ，所以：
+#   - call_async() 不用等待上一个调用返回，可以连续发送多个请求；
+#   - pipeline() 中的属性读取和方法调用会先记录下来，退出 with 语句时合并成一个请求，只需要一次往返；
+#   - 服务端在类属性 _immutable 中声明(或者客户端通过 immutable 参数指定)的不可变属性，
+#     第一次读取以后就缓存在客户端，需要时调用 invalidate() 清除。
+# 连接上传输的是 pickle 数据，反序列化不可信的数据就等于执行任意代码，
+# 所以 start_server() 默认生成一个随机的 authkey ，只有知道它的客户端才能连接；
+# 服务端也只允许访问公共属性和 _describe() 中列出的方法，不能借此调用 __class__ 这样的特殊属性。
+import os
+import time
+import threading
+import itertools
+from concurrent.futures import Future
+from multiprocessing import Process, Pipe
+from multiprocessing.connection import Listener, Client
+
+def _describe(obj):
+    cls = type(obj)
+    methods = [name for name in dir(cls) if not name.startswith('_') and callable(getattr(cls, name))]
+    return methods, tuple(getattr(cls, '_immutable', ()))
+
+def _serve_connection(obj, conn):
+    description = _describe(obj)
+    methods = frozenset(description[0])
+    conn.send(description)
+    try:
+        while True:
+            request = conn.recv()
+            if request is None:
+                break
+            req_id, ops = request
+            results = []
+            for op, name, args, kwargs in ops:
+                try:
+                    if name.startswith('_') or (op == 'call') != (name in methods):
+                        raise AttributeError('{} {!r} is not allowed'.format(op, name))
+                    if op == 'get':
+                        value = getattr(obj, name)
+                    elif op == 'set':
+                        value = setattr(obj, name, args[0])
+                    else:
+                        value = getattr(obj, name)(*args, **kwargs)
+                    results.append((True, value))
+                except Exception as e:
+                    results.append((False, e))
+            conn.send((req_id, results))
+    except EOFError:
+        pass
+    finally:
+        conn.close()
+
+def serve_object(obj, listener):
+    """在 listener 上接受连接，每个连接使用一个线程处理"""
+    while True:
+        conn = listener.accept()
+        threading.Thread(target=_serve_connection, args=(obj, conn), daemon=True).start()
+
+def _run_server(obj, address, authkey, conn):
+    listener = Listener(address, authkey=authkey)
+    conn.send(listener.address)
+    conn.close()
+    serve_object(obj, listener)
+
+def start_server(obj, address=('127.0.0.1', 0), authkey=None):
+    """在子进程中提供 obj ，返回进程、实际监听的地址和 authkey"""
+    if authkey is None:
+        authkey = os.urandom(32)
+    # 监听的套接字在子进程中创建，这样使用 spawn 方式启动子进程时也可以工作
+    parent_conn, child_conn = Pipe(duplex=False)
+    proc = Process(target=_run_server, args=(obj, address, authkey, child_conn), daemon=True)
+    proc.start()
+    child_conn.close()
+    address = parent_conn.recv()
+    parent_conn.close()
+    return proc, address, authkey
+
+class _Pipeline:
+    def __init__(self, proxy):
+        self._proxy = proxy
+        self._ops = []
+        self._futures = []
+    def __enter__(self):
+        return self
+    def __exit__(self, exc_ty, exc_val, tb):
+        if exc_ty is None:
+            self.execute()
+        else:
+            # 发生异常时不发送请求，取消所有的 Future ，否则等待它们的代码会一直阻塞
+            for fut in self._futures:
+                fut.cancel()
+            self._ops, self._futures = [], []
+    def _add(self, op, name, args=(), kwargs=None):
+        fut = Future()
+        self._ops.append((op, name, args, kwargs))
+        self._futures.append(fut)
+        return fut
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        proxy = self._proxy
+        if name in proxy._methods:
+            return lambda *args, **kwargs: self._add('call', name, args, kwargs)
+        try:
+            value = proxy._cache[name]
+        except KeyError:
+            return self._add('get', name)
+        fut = Future()
+        fut.set_result(value)
+        return fut
+    def execute(self):
+        """把记录下来的操作作为一个请求发送出去"""
+        if self._ops:
+            self._proxy._submit(self._ops, self._futures)
+            self._ops, self._futures = [], []
+
+class RemoteProxy:
+    def __init__(self, address, authkey=None, immutable=()):
+        conn = Client(address, authkey=authkey)
+        methods, server_immutable = conn.recv()
+        # 属性赋值会转发到远程对象，所以这里的内部属性要绕过 __setattr__
+        init = super().__setattr__
+        init('_conn', conn)
+        init('_methods', frozenset(methods))
+        init('_immutable', frozenset(server_immutable) | frozenset(immutable))
+        init('_cache', {})
+        init('_pending', {})
+        init('_ids', itertools.count())
+        init('_lock', threading.Lock())
+        reader = threading.Thread(target=self._read_responses, daemon=True)
+        init('_reader', reader)
+        reader.start()
+
+    def _submit(self, ops, futures=None):
+        if futures is None:
+            futures = [Future() for _ in ops]
+        with self._lock:
+            req_id = next(self._ids)
+            self._pending[req_id] = (ops, futures)
+            try:
+                self._conn.send((req_id, ops))
+            except Exception:
+                del self._pending[req_id]
+                raise
+        return futures
+
+    def _read_responses(self):
+        cache, immutable = self._cache, self._immutable
+        try:
+            while True:
+                req_id, results = self._conn.recv()
+                ops, futures = self._pending.pop(req_id)
+                for (op, name, _, _), fut, (ok, value) in zip(ops, futures, results):
+                    if not ok:
+                        fut.set_exception(value)
+                        continue
+                    if op == 'get' and name in immutable:
+                        cache[name] = value
+                    fut.set_result(value)
+        except (EOFError, OSError):
+            pass
+        # 连接已经断开，还在等待的调用都不会有结果了
+        with self._lock:
+            pending = list(self._pending.values())
+            self._pending.clear()
+        for _, futures in pending:
+            for fut in futures:
+                if not fut.done():
+                    fut.set_exception(ConnectionError('connection closed'))
+
+    def get_async(self, name):
+        try:
+            value = self._cache[name]
+        except KeyError:
+            return self._submit([('get', name, (), None)])[0]
+        fut = Future()
+        fut.set_result(value)
+        return fut
+
+    def call_async(self, name, *args, **kwargs):
+        return self._submit([('call', name, args, kwargs)])[0]
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        try:
+            return self._cache[name]
+        except KeyError:
+            pass
+        if name in self._methods:
+            return lambda *args, **kwargs: self.call_async(name, *args, **kwargs).result()
+        return self.get_async(name).result()
+
+    def __setattr__(self, name, value):
+        self._cache.pop(name, None)
+        self._submit([('set', name, (value,), None)])[0].result()
+
+    def pipeline(self):
+        return _Pipeline(self)
+
+    def invalidate(self, *names):
+        """清除缓存的不可变属性，不指定名称时全部清除"""
+        if names:
+            for name in names:
+                self._cache.pop(name, None)
+        else:
+            self._cache.clear()
+
+    def close(self):
+        # 关闭本地的连接并不能唤醒阻塞在 recv() 中的线程，所以先通知服务端关闭连接，
+        # 读线程收到 EOF 以后自然结束，在此之前发出的请求也都会得到响应
+        with self._lock:
+            self._conn.send(None)
+        self._reader.join()
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+    def __exit__(self, exc_ty, exc_val, tb):
+        self.close()
+
+# 使用演示，服务端在一个子进程中运行：
+class Inventory:
+    _immutable = ('name',)
+    def __init__(self, name, size):
+        self.name = name
+        self.counts = [0] * size
+    def count(self, i):
+        return self.counts[i]
+    def add(self, i, n=1):
+        self.counts[i] += n
+        return self.counts[i]
+
+def demo_remote(address, authkey):
+    with RemoteProxy(address, authkey) as inv:
+        print(inv.name, inv.add(3, 5), inv.count(3))
+        with inv.pipeline() as pipe:
+            name = pipe.name
+            totals = [pipe.add(i) for i in range(5)]
+            size = pipe.counts
+            bad = pipe.count(10**6)
+        print(name.result(), [t.result() for t in totals], len(size.result()))
+        try:
+            bad.result()
+        except IndexError as e:
+            print('IndexError:', e)
+        inv.name = 'depot'
+        print(inv.name)
+        futures = [inv.call_async('add', 7) for _ in range(10)]
+        assert [f.result() for f in futures] == list(range(1, 11))
+        try:
+            inv.call_async('__init__', 'x', 1).result()
+        except AttributeError as e:
+            print('AttributeError:', e)
+
+# 对比一下每次调用一个往返、连续发送异步请求和 pipeline 三种方式：
+def bench_remote(address, authkey, n=20000, batch=100):
+    with RemoteProxy(address, authkey) as inv:
+        start = time.perf_counter()
+        for i in range(n):
+            inv.count(i % 1000)
+        sync = time.perf_counter() - start
+        start = time.perf_counter()
+        futures = [inv.call_async('count', i % 1000) for i in range(n)]
+        for fut in futures:
+            fut.result()
+        async_ = time.perf_counter() - start
+        start = time.perf_counter()
+        for i in range(0, n, batch):
+            with inv.pipeline() as pipe:
+                futures = [pipe.count(j % 1000) for j in range(i, i + batch)]
+            futures[-1].result()
+        piped = time.perf_counter() - start
+        start = time.perf_counter()
+        for i in range(n):
+            inv.name
+        cached = time.perf_counter() - start
+    for label, elapsed in [('round trip', sync), ('call_async', async_),
+                           ('pipeline', piped), ('cached', cached)]:
+        print('{:>10}: {:.3f}s, {:.1f}us/call, {:.0f} calls/s'.format(
+            label, elapsed, elapsed / n * 1e6, n / elapsed))
+
+# 子进程使用 spawn 方式启动时会重新导入这个模块，所以启动服务端的代码要放在 __main__ 判断中
+if __name__ == '__main__':
+    server, address, authkey = start_server(Inventory('warehouse', 1000))
+    demo_remote(address, authkey)
+    bench_remote(address, authkey)
+    server.terminate()
+# 在本机回环地址上，一次往返大约需要几十微秒，主要花在两个进程之间的切换和系统调用上。
+# call_async 省掉了等待，但每个请求仍然要单独序列化和发送；
+# pipeline 把100个调用合成一个请求，每个调用的平均开销降低到了原来的五分之一左右，
+# 剩下的主要是序列化和为每个调用创建 Future 的开销；不可变属性缓存以后就完全不需要通信了。
+
+# 扩展：自动生成协议方法的代理
+# 上面手写的 ListLike 中，append() 这些普通方法要先查找失败再进入 __getattr__ ，
+# __len__ 、__getitem__ 这些方法也都多了一层Python函数调用。
+# 下面的 delegate_to() 类装饰器为协议(比如 MutableSequence)中的每个方法生成一个直接转发的函数，
+# 和 make_proxy() 一样，__len__ 、__getitem__ 这些会直接写成 len(self._items) 、self._items[a0] 。
+# 本来也可以像 make_proxy() 那样安装 property(attrgetter('_items.append')) ，直接返回内部对象的绑定方法，
+# 特殊方法也可以这样做(解释器查找到的不是函数时，会先调用它的 __get__() )。
+# 但是在Python 3.11中测试下来，这种方式反而更慢：每次都要创建一个绑定方法，
+# 而普通的Python函数会被解释器特化，x[i] 调用 __getitem__ 时甚至不需要新建C语言层面的调用栈。
+# __iadd__ 这样的就地运算要返回代理对象本身，所以使用协议中自带的实现。
+from collections.abc import MutableSequence
+from array import array
+from types import FunctionType
+
+def delegate_to(attr, protocol=MutableSequence, target=None, fallback=False):
+    """
+    把 protocol 中的方法转发给 attr 属性保存的对象，类中已经定义的方法不会被覆盖。
+    如果指定了 target 类型，它没有的方法会使用 protocol 中的默认实现；
+    fallback 为真时，其他属性像 ListLike 那样通过 __getattr__ 转发
+    """
+    def decorate(cls):
+        names = {}
+        for klass in reversed(protocol.__mro__[:-1]):
+            for name, value in vars(klass).items():
+                if isinstance(value, FunctionType):
+                    names[name] = value
+        forwarded = []
+        for name, value in names.items():
+            if name in cls.__dict__:
+                continue
+            inplace = name.startswith('__i') and name[3:-2] in _INPLACE
+            if inplace or (target is not None and not hasattr(target, name)):
+                if not getattr(value, '__isabstractmethod__', False):
+                    setattr(cls, name, value)
+            else:
+                forwarded.append((name, _dunder_params(value)))
+        env = {}
+        exec(_make_forwards((), forwarded, 'self.' + attr), env)
+        for name, _ in forwarded:
+            func = env[name]
+            func.__qualname__ = '{}.{}'.format(cls.__qualname__, name)
+            setattr(cls, name, func)
+        if fallback and '__getattr__' not in cls.__dict__:
+            # 定义了 __getattr__ 的类，解释器不会再对它的属性访问做特化，所以默认不使用
+            def __getattr__(self, name):
+                if name == attr:
+                    raise AttributeError(name)
+                return getattr(getattr(self, attr), name)
+            cls.__getattr__ = __getattr__
+        protocol.register(cls)
+        return cls
+    return decorate
+
+@delegate_to('_items')
+class DelegatedList:
+    def __init__(self, items=()):
+        self._items = list(items)
+    def sort(self, *, key=None, reverse=False):
+        self._items.sort(key=key, reverse=reverse)
+    def __repr__(self):
+        return 'DelegatedList({!r})'.format(self._items)
+
+a = DelegatedList([3, 1])
+a.append(2)
+a.insert(0, 4)
+a.sort()
+a += [5, 6]
+a[0] = 0
+del a[-1]
+print(a, len(a), a[1:3], 5 in a, list(reversed(a)), a.index(3), isinstance(a, MutableSequence))
+
+# 对于数值类型，可以在内部使用 array.array 保存，每个元素只占几个字节，而不是一个完整的Python对象。
+# array 的切片赋值要求右边也是同类型的 array ，所以这里单独实现了 __setitem__ ；
+# extend() 直接转发给 array.extend() ，参数是同类型的 array 时就是一次内存复制，不会为每个元素创建对象。
+@delegate_to('_items', target=array)
+class TypedList:
+    def __init__(self, typecode, items=()):
+        self._items = array(typecode, items)
+    def __setitem__(self, index, value):
+        if isinstance(index, slice) and not isinstance(value, array):
+            value = array(self._items.typecode, value)
+        self._items[index] = value
+    def clear(self):
+        del self._items[:]
+    @property
+    def typecode(self):
+        return self._items.typecode
+    def tobytes(self):
+        return self._items.tobytes()
+    def __repr__(self):
+        return 'TypedList({!r}, {!r})'.format(self._items.typecode, self._items.tolist())
+
+t = TypedList('d', [1, 2, 3])
+t.extend(array('d', [4, 5]))
+t[1:3] = [20, 30, 40]
+t[0] = 10
+t += range(2)
+print(t, len(t), t[2], list(reversed(t))[:2], t.count(0.0), len(t.tobytes()))
+t.clear()
+print(t)
+
+# 对比一下 append 、按索引访问和迭代的速度：
+def bench_delegate(n=10**6):
+    def run(items):
+        start = time.perf_counter()
+        for i in range(n):
+            items.append(i)
+        t_append = time.perf_counter() - start
+        start = time.perf_counter()
+        for i in range(n):
+            items[i]
+        t_index = time.perf_counter() - start
+        start = time.perf_counter()
+        for x in items:
+            pass
+        t_iter = time.perf_counter() - start
+        return t_append, t_index, t_iter
+    for label, items in [('list', []), ('ListLike', ListLike()),
+                         ('delegate_to', DelegatedList()), ('TypedList', TypedList('q'))]:
+        print('{:>11}: append {:.3f}s, index {:.3f}s, iterate {:.3f}s'.format(label, *run(items)))
+
+bench_delegate()
+# delegate_to 生成的转发函数让 append 快了10倍左右(不再先查找失败再进入 __getattr__ )，
+# 按索引访问也比手写的 __getitem__ 快一些，因为没有 __getattr__ 的类才能被解释器特化；
+# 迭代直接使用内部列表的迭代器，和 list 一样快(ListLike 没有 __iter__ ，只能通过 __getitem__ 一个个取)。
+# 和 list 相比仍然多了一层Python函数调用，对性能要求很高的循环里，可以先取出 items._items 再操作。
+# TypedList 稍慢一些，因为 array 取出元素时要重新创建数值对象，但它占用的内存只有 list 的几分之一。
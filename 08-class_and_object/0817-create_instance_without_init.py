@@ -47,3 +47,326 @@ class Date:
 # 当你通过这种非常规方式来创建实例的时候，最好不要直接去访问底层实例字典，除非你真的清楚所有细节。
 # 否则的话，如果这个类使用了 __slots__ 、properties 、descriptors 或其他高级技术的时候代码就会失效。 
 # 而这时候使用 setattr() 方法会让你的代码变得更加通用。
+
+# 扩展：批量反序列化
+# 如果要把上百万条像 {'year': 2012, 'month': 8, 'day': 29} 这样的JSON记录转换成 Date 实例，
+# 像上面那样每条记录都 __new__() 一次再循环调用 setattr() 就太慢了。
+# 下面的 bulk_from_dicts() 会为每个类预先生成一个构造计划：
+#   - 字段名来自 __slots__ 或者 fields 参数，根据字段名生成一段 obj.year = d['year'] 这样的代码，
+#     没有循环，也没有 setattr() 的函数调用，赋值依然会经过property和描述器，所以类型检查等逻辑不会被绕过
+#   - 字段名会被拼接到代码中，所以必须是合法的标识符，否则抛出 ValueError
+#   - 没有 __slots__ 也没有指定 fields 的类，不会根据数据中的键生成代码(这些键可能来自不可信的输入)。
+#     如果记录中的键都是字符串，并且没有一个对应类中的数据描述器(property等)，
+#     就直接用 obj.__dict__.update(d) 一次设置所有属性；否则才对每个键逐个调用 setattr()
+#     (类中有哪些数据描述器是每次调用时重新检查的，不会被缓存)
+# 计划只在第一次使用某个类时生成，之后的调用直接复用。
+import keyword
+from collections import deque
+from itertools import repeat
+
+_plans = {}
+
+def _slot_names(cls):
+    names = []
+    for klass in cls.__mro__:
+        slots = klass.__dict__.get('__slots__', ())
+        names.extend([slots] if isinstance(slots, str) else slots)
+    return tuple(name for name in names if name not in ('__dict__', '__weakref__'))
+
+def _check_fields(fields):
+    for name in fields:
+        if not isinstance(name, str) or not name.isidentifier() or keyword.iskeyword(name):
+            raise ValueError('invalid field name: {!r}'.format(name))
+
+def _make_plan(cls, fields, source):
+    _check_fields(fields)
+    if source == 'dict':
+        body = ['        obj.{0} = d[{0!r}]'.format(name) for name in fields]
+    else:
+        body = ['        {}, = d'.format(', '.join('obj.' + name for name in fields))]
+    code = '\n'.join([
+        'def build(records):',
+        '    new = cls.__new__',
+        '    result = []',
+        '    append = result.append',
+        '    for d in records:',
+        '        obj = new(cls)',
+        *body,
+        '        append(obj)',
+        '    return result',
+    ])
+    env = {'cls': cls}
+    exec(code, env)
+    return env['build']
+
+def _plan(cls, fields, source):
+    key = (cls, fields, source)
+    build = _plans.get(key)
+    if build is None:
+        build = _plans[key] = _make_plan(cls, fields, source)
+    return build
+
+def _data_descriptors(cls):
+    """类中所有数据描述器的名字，对这些名字赋值时不能绕过 setattr()"""
+    names = set()
+    for klass in cls.__mro__:
+        for name, attr in vars(klass).items():
+            if hasattr(type(attr), '__set__') or hasattr(type(attr), '__delete__'):
+                names.add(name)
+    return frozenset(names)
+
+def _from_dicts(cls, records):
+    new = cls.__new__
+    result = []
+    append = result.append
+    for d in records:
+        obj = new(cls)
+        for name, value in d.items():
+            setattr(obj, name, value)
+        append(obj)
+    return result
+
+def _update_dicts(cls, records):
+    objs = list(map(cls.__new__, repeat(cls, len(records))))
+    # vars() 和 dict.update() 都是C函数，整个循环中没有执行任何Python字节码
+    deque(map(dict.update, map(vars, objs), records), maxlen=0)
+    return objs
+
+def bulk_from_dicts(cls, records, fields=None):
+    """不调用 __init__() ，用一组字典批量创建cls的实例。
+    没有指定fields时使用 __slots__ ，都没有时原样设置每条记录中的所有键"""
+    if fields is None:
+        fields = _slot_names(cls)
+    if not fields:
+        if not isinstance(records, (list, tuple)):
+            records = list(records)
+        # 先在C中收集所有记录中出现过的键，只需要检查一次
+        keys = frozenset().union(*records)
+        descriptors = _data_descriptors(cls)
+        # 有实例字典的类，它的某个基类中一定有 __dict__ 这个数据描述器
+        if ('__dict__' in descriptors and descriptors.isdisjoint(keys)
+                and all(isinstance(name, str) for name in keys)):
+            return _update_dicts(cls, records)
+        return _from_dicts(cls, records)
+    return _plan(cls, tuple(fields), 'dict')(records)
+
+def from_rows(cls, rows, fields=None):
+    """和 bulk_from_dicts() 一样，不过每条记录是按fields顺序排列的元组"""
+    fields = _slot_names(cls) if fields is None else tuple(fields)
+    if not fields:
+        raise TypeError('fields must be given for {}'.format(cls.__name__))
+    return _plan(cls, fields, 'row')(rows)
+
+class SlotDate:
+    __slots__ = ('year', 'month', 'day')
+    def __init__(self, year, month, day):
+        self.year = year
+        self.month = month
+        self.day = day
+
+records = [{'year': 2012, 'month': 8, 'day': 29}, {'year': 2023, 'month': 6, 'day': 15}]
+dates = bulk_from_dicts(Date, records)
+print([(d.year, d.month, d.day) for d in dates])
+dates = bulk_from_dicts(SlotDate, records)
+print([(d.year, d.month, d.day) for d in dates])
+dates = from_rows(Date, [(2012, 8, 29), (2023, 6, 15)], fields=('year', 'month', 'day'))
+print([(d.year, d.month, d.day) for d in dates])
+
+# 有property时，对应的键依然会经过 setattr() ，类型检查不会被绕过
+class CheckedDate(Date):
+    @property
+    def month(self):
+        return self._month
+    @month.setter
+    def month(self, value):
+        if not 1 <= value <= 12:
+            raise ValueError('bad month: {}'.format(value))
+        self._month = value
+
+try:
+    bulk_from_dicts(CheckedDate, records + [{'year': 2012, 'month': 13, 'day': 1}])
+except ValueError as e:
+    print(e)
+
+# 比较一下每秒能创建多少条记录：
+import time
+
+def bench(n=10**6):
+    records = [{'year': 2000 + i % 50, 'month': 1 + i % 12, 'day': 1 + i % 28} for i in range(n)]
+    rows = [(d['year'], d['month'], d['day']) for d in records]
+
+    def setattr_loop(cls):
+        result = []
+        for data in records:
+            d = cls.__new__(cls)
+            for k, v in data.items():
+                setattr(d, k, v)
+            result.append(d)
+        return result
+
+    cases = [
+        ('Date(**d)', lambda: [Date(**d) for d in records]),
+        ('setattr loop', lambda: setattr_loop(Date)),
+        ('bulk_from_dicts(Date)', lambda: bulk_from_dicts(Date, records)),
+        ('bulk_from_dicts(Date, fields)', lambda: bulk_from_dicts(Date, records, ('year', 'month', 'day'))),
+        ('bulk_from_dicts(SlotDate)', lambda: bulk_from_dicts(SlotDate, records)),
+        ('from_rows(SlotDate)', lambda: from_rows(SlotDate, rows)),
+    ]
+    for label, build in cases:
+        start = time.perf_counter()
+        build()
+        elapsed = time.perf_counter() - start
+        print('{:>30}: {:.0f} records/s'.format(label, n / elapsed))
+
+if __name__ == '__main__':
+    bench()
+# 指定了字段名时，生成的代码比 setattr() 循环快一些，使用 __slots__ 的类还会更快；
+# 没有字段名的普通类直接更新实例字典，比 setattr() 循环快得多，和直接调用 Date(**d) 差不多。
+# Date(**d) 本身已经很快了：Python 3.11会专门优化 __init__() 中的属性赋值。
+# 记录数很多时，创建大量对象触发的循环垃圾回收会占掉相当一部分时间，可以参考8.23小节关于gc的讨论。
+# 生成的计划中都是普通的属性赋值，即使之后给类添加了描述器，缓存的计划依然是正确的。
+
+# 扩展：从文件中流式地创建实例
+# 上面的 today() 只能从时钟构造实例，而实际中更常见的是从一个很大的文件中读取记录。
+# 下面的 iter_objects() 逐块读取按行分隔的JSON(ndjson)或者CSV文件，每读取chunksize条记录就解析一次，
+# 然后用 bulk_from_dicts()/from_rows() 创建实例并逐个产生出来，整个文件从来不会被一次性读入内存。
+# 对于很大的输入，还可以指定processes把解析的工作交给多个子进程，
+# 同时在途的块最多只有 2*processes 个，所以内存占用依然是固定的。
+import csv
+import json
+from collections import deque
+from itertools import islice
+from operator import itemgetter
+
+def _read_chunks(it, chunksize):
+    return iter(lambda: list(islice(it, chunksize)), [])
+
+def _parse_chunk(fmt, chunk, fields, converters, indices=None):
+    """把一块记录解析成元组，在子进程中执行时返回的结果也比字典更容易序列化"""
+    if fmt == 'ndjson':
+        # 把整块拼成一个JSON数组，只需要调用一次 json.loads()
+        records = json.loads('[' + ','.join(line for line in chunk if line.strip()) + ']')
+        if len(fields) == 1:
+            return [(d[fields[0]],) for d in records]
+        return list(map(itemgetter(*fields), records))
+    # CSV的块已经由 csv.reader 拆分成了行，这里按字段在表头中的位置取值
+    if converters:
+        funcs = [converters.get(name, str) for name in fields]
+        return [tuple(func(row[i]) for func, i in zip(funcs, indices)) for row in chunk if row]
+    return [tuple(row[i] for i in indices) for row in chunk if row]
+
+def iter_batches(cls, path, fmt='ndjson', fields=None, converters=None,
+                 chunksize=10000, processes=0):
+    """逐块产生cls实例的列表。CSV文件的第一行是字段名，converters用来转换字段的类型，
+    fields可以是表头中字段的任意子集和顺序"""
+    indices = None
+    with open(path, newline='') as f:
+        if fmt == 'csv':
+            # 按记录而不是按物理行分块，带引号的字段中可以包含换行符
+            reader = csv.reader(f)
+            header = next(reader, [])
+            fields = tuple(fields or header)
+            missing = [name for name in fields if name not in header]
+            if missing:
+                raise ValueError('fields not in CSV header: {}'.format(', '.join(missing)))
+            indices = [header.index(name) for name in fields]
+            chunks = _read_chunks(reader, chunksize)
+        elif fields is None:
+            fields = _slot_names(cls)
+            if not fields:
+                first = f.readline()
+                fields = tuple(json.loads(first))
+                f.seek(0)
+        if fmt != 'csv':
+            chunks = _read_chunks(f, chunksize)
+        fields = tuple(fields)
+        if not processes:
+            for chunk in chunks:
+                yield from_rows(cls, _parse_chunk(fmt, chunk, fields, converters, indices), fields)
+            return
+        from multiprocessing import Pool
+        with Pool(processes) as pool:
+            pending = deque()
+            for chunk in chunks:
+                pending.append(pool.apply_async(_parse_chunk, (fmt, chunk, fields, converters, indices)))
+                if len(pending) >= 2 * processes:
+                    yield from_rows(cls, pending.popleft().get(), fields)
+            while pending:
+                yield from_rows(cls, pending.popleft().get(), fields)
+
+def iter_objects(cls, path, **kwargs):
+    for batch in iter_batches(cls, path, **kwargs):
+        yield from batch
+
+# 结合8.16小节的类方法，就可以得到一个新的构造函数：
+class StreamDate(SlotDate):
+    __slots__ = ()
+    @classmethod
+    def from_file(cls, path, **kwargs):
+        return iter_objects(cls, path, **kwargs)
+
+import os
+import tempfile
+
+with tempfile.TemporaryDirectory() as tmp:
+    path = os.path.join(tmp, 'dates.ndjson')
+    with open(path, 'w') as f:
+        for d in records:
+            f.write(json.dumps(d) + '\n')
+    for d in StreamDate.from_file(path):
+        print(d.year, d.month, d.day)
+    path = os.path.join(tmp, 'dates.csv')
+    with open(path, 'w') as f:
+        f.write('year,month,day\n2012,8,29\n2023,6,15\n')
+    for d in StreamDate.from_file(path, fmt='csv', converters={'year': int, 'month': int, 'day': int}):
+        print(d.year, d.month, d.day)
+    # 字段按名字而不是按位置对应，顺序可以和表头不同
+    for d in StreamDate.from_file(path, fmt='csv', fields=('day', 'month', 'year'), converters={'year': int}):
+        print(d.year, d.month, d.day)
+    # 带引号的字段中包含换行符时，依然是一条记录
+    class Note:
+        pass
+    path = os.path.join(tmp, 'notes.csv')
+    with open(path, 'w', newline='') as f:
+        f.write('name,note\na,"line1\nline2"\nb,plain\n')
+    for n in iter_objects(Note, path, fmt='csv', chunksize=1):
+        print(n.name, repr(n.note))
+
+# 下面的测试会先生成一个指定大小的合成数据文件，然后流式地读取它，并报告吞吐量和内存峰值。
+# size_mb=1024 就是1GB的输入，这里默认只用一个小文件。
+# 因为进程的RSS峰值只增不减，会受到前面例子的影响，这里用 tracemalloc 单独统计一遍Python的内存分配。
+import tracemalloc
+
+def generate(path, size_mb):
+    line = json.dumps({'year': 2012, 'month': 8, 'day': 29}) + '\n'
+    block = line * 10000
+    with open(path, 'w') as f:
+        for _ in range(size_mb * 2**20 // len(block) + 1):
+            f.write(block)
+
+def bench_stream(size_mb=32, processes=0):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'dates.ndjson')
+        generate(path, size_mb)
+        start = time.perf_counter()
+        n = 0
+        for _ in iter_objects(SlotDate, path, processes=processes):
+            n += 1
+        elapsed = time.perf_counter() - start
+        tracemalloc.start()
+        for _ in iter_objects(SlotDate, path, processes=processes):
+            pass
+        peak = tracemalloc.get_traced_memory()[1] / 2**20
+        tracemalloc.stop()
+        print('{}MB, processes={}: {} records {:.2f}s ({:.0f} records/s), peak {:.1f}MB'.format(
+            size_mb, processes, n, elapsed, n / elapsed, peak))
+
+# 使用 spawn 方式启动子进程(macOS和Windows上的默认方式)时，子进程会重新导入这个模块，
+# 所以测试只在作为主程序运行时执行，否则每个子进程都会再跑一遍测试，并且在子进程中再创建进程池
+if __name__ == '__main__':
+    bench_stream()
+    bench_stream(processes=2)
+# 内存峰值只和chunksize有关，和输入文件的大小无关(可以把size_mb改大来验证)。
+# 使用多进程时，子进程只负责解析JSON，结果以元组的形式传回来，实例依然是在主进程中创建的。
+# 对于这种很简单的记录，解析本身已经很快，进程间传递数据的开销反而更大，多进程并不会更快；
+# 只有在每条记录的解析或转换比较耗时的时候，才值得使用processes参数。
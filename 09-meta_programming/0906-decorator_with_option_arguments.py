@@ -62,4 +62,60 @@ spam2 = logged(level=logging.CRITICAL, name='example')(spam2)
 # 这个反过来会迫使其他参数必须使用关键字来指定。 并且，但这些参数被传递进来后，
 # 装饰器要返回一个接受一个函数参数并包装它的函数(参考9.5小节)。 
 # 为了这样做，我们使用了一个技巧，就是利用 functools.partial 。 
-# 它会返回一个未完全初始化的自身，除了被包装函数外其他参数都已经确定下来了。
\ No newline at end of file
+# 它会返回一个未完全初始化的自身，除了被包装函数外其他参数都已经确定下来了。
+
+# 扩展：9.5小节的最后介绍了一个在日志被关闭时把名字重新绑定到原始函数的 logged ，
+# 它同样可以写成可选参数的形式，只是在开头加上同样的 partial 技巧：
+import sys
+
+def logged(func=None, *, level=logging.DEBUG, name=None, message=None, rebind=False):
+    if func is None:
+        return partial(logged, level=level, name=name, message=message, rebind=rebind)
+    logname = name if name else func.__module__
+    log = logging.getLogger(logname)
+    logmsg = message if message else func.__name__
+    binding = None if rebind else False
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        if log.isEnabledFor(level):
+            log.log(level, logmsg)
+        elif binding is not False:
+            refresh()
+        return func(*args, **kwargs)
+
+    def refresh():
+        # 日志被关闭时，把模块中的名字直接绑定到原始函数上，之后的调用就没有任何额外开销了；
+        # 绑定的位置只查找一次，无法重新绑定时记为False
+        nonlocal binding
+        if binding is None:
+            owner = None
+            if '<locals>' not in func.__qualname__:
+                owner = sys.modules.get(func.__module__)
+                *path, attr = func.__qualname__.split('.')
+                for part in path:
+                    owner = getattr(owner, part, None)
+            if owner is None or vars(owner).get(attr) not in (wrapper, func):
+                binding = False
+                return
+            binding = (owner, attr)
+        elif binding is False:
+            return
+        owner, attr = binding
+        if vars(owner).get(attr) in (wrapper, func):
+            setattr(owner, attr, wrapper if log.isEnabledFor(level) else func)
+
+    wrapper.refresh = func.refresh = refresh
+    return wrapper
+
+@logged(level=logging.INFO, rebind=True)
+def sub(x, y):
+    return x - y
+
+print(sub(3, 2), hasattr(sub, '__wrapped__'))
+logging.disable(logging.INFO)
+print(sub(3, 2), hasattr(sub, '__wrapped__'))
+logging.disable(logging.NOTSET)
+# 重新绑定以后不会再检查日志级别，所以重新打开日志以后必须手动调用 refresh() ，否则日志会丢失
+sub.refresh()
+print(sub(3, 2), hasattr(sub, '__wrapped__'))
@@ -2,4 +2,220 @@
 # 作为某种编程规约，你想在对函数参数进行强制类型检查。
 
 # 解决方案
-# 在演示实际代码前，先说明我们的目标：能对函数参数类型进行断言，类似下面这样：
\ No newline at end of file
+# 在演示实际代码前，先说明我们的目标：能对函数参数类型进行断言，类似下面这样：
+# >>> @typeassert(int, int)
+# ... def add(x, y):
+# ...     return x + y
+# >>> add(2, 3)
+# 5
+# >>> add(2, 'hello')
+# TypeError: Argument y must be <class 'int'>
+
+# 下面是使用装饰器技术来实现 @typeassert ：
+from inspect import signature
+from functools import wraps
+
+def typeassert(*ty_args, **ty_kwargs):
+    def decorate(func):
+        # If in optimized mode, disable type checking
+        if not __debug__:
+            return func
+
+        # Map function argument names to supplied types
+        sig = signature(func)
+        bound_types = sig.bind_partial(*ty_args, **ty_kwargs).arguments
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            bound_values = sig.bind(*args, **kwargs)
+            # Enforce type assertions across supplied arguments
+            for name, value in bound_values.arguments.items():
+                if name in bound_types:
+                    if not isinstance(value, bound_types[name]):
+                        raise TypeError(
+                            'Argument {} must be {}'.format(name, bound_types[name]))
+            return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+# 可以看出这个装饰器非常灵活，既可以指定所有参数类型，也可以只指定部分。
+# 并且可以通过位置或关键字来指定参数类型。下面是使用示例：
+@typeassert(int, z=int)
+def spam(x, y, z=42):
+    print(x, y, z)
+
+spam(1, 2, 3)
+spam(1, 'hello', 3)
+try:
+    spam(1, 'hello', 'world')
+except TypeError as e:
+    print(e)
+
+# 讨论
+# 这个装饰器首先检查 __debug__ ，如果Python解释器以优化模式运行(-O 或 -OO)，
+# 装饰器直接返回未修改的函数，类型检查被完全去掉了。
+# 然后 inspect.signature() 用来提取函数的参数签名信息，bind_partial() 把指定的类型绑定到参数名上。
+# 在包装器中，sig.bind() 把实际传入的参数绑定到参数名上，再逐个检查类型。
+
+# 扩展：编译出来的参数检查
+# 上面的方案在每次调用时都要执行一次 sig.bind() ，它是用纯Python实现的，非常慢。
+# 其实参数绑定这件事Python解释器自己就能做：只要生成一个和原函数参数签名完全一样的包装函数，
+# 调用时解释器就已经把参数绑定到了各个名字上，包装器中只需要对每个参数执行一次 isinstance() 。
+# 下面的版本在装饰时用代码生成这样一个包装器，并且支持 list[int] 这样的泛型类型：
+# 默认只检查外层的类型(list)，如果指定了 deep=k ，还会随机抽查k个元素的类型。
+# 字典和其他不支持下标访问的容器没法在O(k)时间内随机抽样，所以检查的是迭代出来的前k个元素。
+# typing.Any 的参数不做检查；Literal 这类不能用于 isinstance() 的类型，在装饰时就会抛出 TypeError 。
+_bind_typeassert = typeassert    # 保留上面的版本，用来做性能对比
+
+import random
+import types
+from collections.abc import Collection, Mapping, Sequence
+from inspect import Parameter
+from itertools import islice
+from typing import Any, Literal, Union, get_args, get_origin
+
+def _sample(values, k):
+    if isinstance(values, Sequence) and len(values) > k:
+        return [values[i] for i in random.sample(range(len(values)), k)]
+    return islice(values, k)
+
+def _checker(tp, deep):
+    """返回一个检查值是否符合类型tp的函数"""
+    outer, inner = _compile_type(tp, deep)
+    if inner is None:
+        return lambda value: isinstance(value, outer)
+    return lambda value: isinstance(value, outer) and inner(value)
+
+def _runtime_type(tp):
+    """返回 isinstance() 能够使用的类型，Any 对应 object"""
+    if tp is Any:
+        return object
+    if isinstance(tp, type) or (isinstance(tp, tuple) and all(isinstance(t, type) for t in tp)):
+        return tp
+    raise TypeError('Unsupported type for typeassert: {!r}'.format(tp))
+
+def _compile_type(tp, deep):
+    """返回 (isinstance() 使用的类型, 元素检查函数或None)"""
+    origin = get_origin(tp)
+    if origin is None:
+        return _runtime_type(tp), None
+    args = get_args(tp)
+    if origin is Union or origin is types.UnionType:
+        return tuple(_runtime_type(get_origin(arg) or arg) for arg in args), None
+    if not isinstance(origin, type):
+        raise TypeError('Unsupported type for typeassert: {!r}'.format(tp))
+    if not deep or not args or not issubclass(origin, Collection):
+        return origin, None
+    if issubclass(origin, Mapping):
+        key_ok, value_ok = _checker(args[0], deep), _checker(args[1], deep)
+        return origin, lambda d: all(key_ok(k) and value_ok(v) for k, v in islice(d.items(), deep))
+    if origin is tuple and not (len(args) == 2 and args[1] is Ellipsis):
+        checks = [_checker(arg, deep) for arg in args]
+        return origin, lambda t: len(t) == len(checks) and all(c(v) for c, v in zip(checks, t))
+    item_ok = _checker(args[0], deep)
+    return origin, lambda values: all(map(item_ok, _sample(values, deep)))
+
+def _make_wrapper(sig, checked):
+    """生成和原函数参数签名一样的包装函数的源代码"""
+    params, call = [], []
+    star = False
+    kinds = [p.kind for p in sig.parameters.values()] + [None]
+    for i, p in enumerate(sig.parameters.values()):
+        if p.kind == Parameter.KEYWORD_ONLY and not star:
+            params.append('*')
+            star = True
+        if p.kind == Parameter.VAR_POSITIONAL:
+            params.append('*' + p.name)
+            call.append('*' + p.name)
+            star = True
+        elif p.kind == Parameter.VAR_KEYWORD:
+            params.append('**' + p.name)
+            call.append('**' + p.name)
+        else:
+            default = '' if p.default is Parameter.empty else '=__d_' + p.name
+            params.append(p.name + default)
+            call.append(p.name + '=' + p.name if p.kind == Parameter.KEYWORD_ONLY else p.name)
+        if p.kind == Parameter.POSITIONAL_ONLY and kinds[i + 1] != Parameter.POSITIONAL_ONLY:
+            params.append('/')
+    lines = ['def wrapper({}):'.format(', '.join(params))]
+    for name, has_inner in checked:
+        cond = 'isinstance({0}, __t_{0})'.format(name)
+        if has_inner:
+            cond += ' and __e_{0}({0})'.format(name)
+        lines.append('    if not ({}):'.format(cond))
+        lines.append('        raise TypeError(__m_{})'.format(name))
+    lines.append('    return __func({})'.format(', '.join(call)))
+    return '\n'.join(lines)
+
+def typeassert(*ty_args, deep=0, **ty_kwargs):
+    def decorate(func):
+        if not __debug__:
+            return func
+        sig = signature(func)
+        bound_types = sig.bind_partial(*ty_args, **ty_kwargs).arguments
+        env = {'__func': func}
+        checked = []
+        for name, tp in bound_types.items():
+            kind = sig.parameters[name].kind
+            if kind in (Parameter.VAR_POSITIONAL, Parameter.VAR_KEYWORD):
+                raise TypeError('Cannot assert type of *{}'.format(name))
+            outer, inner = _compile_type(tp, deep)
+            if outer is object and inner is None:
+                continue
+            env['__t_' + name] = outer
+            env['__m_' + name] = 'Argument {} must be {}'.format(name, tp)
+            if inner is not None:
+                env['__e_' + name] = inner
+            checked.append((name, inner is not None))
+        for p in sig.parameters.values():
+            if p.default is not Parameter.empty:
+                env['__d_' + p.name] = p.default
+        exec(_make_wrapper(sig, checked), env)
+        return wraps(func)(env['wrapper'])
+    return decorate
+
+@typeassert(int, z=int)
+def spam(x, y, z=42):
+    print(x, y, z)
+
+spam(1, 'hello', 3)
+try:
+    spam(1, 'hello', 'world')
+except TypeError as e:
+    print(e)
+
+@typeassert(list[int], dict[str, float], deep=3)
+def total(values, weights, /, *, scale=1.0):
+    return sum(values) * scale
+
+print(total([1, 2, 3], {'a': 1.0}))
+try:
+    total([1, 2, 'x'], {'a': 1.0})
+except TypeError as e:
+    print(e)
+
+@typeassert(Any, int)
+def pair(tag, n):
+    return tag, n
+
+print(pair(None, 1))
+try:
+    typeassert(Literal['r', 'w'])(open)
+except TypeError as e:
+    print(e)
+
+# 和使用 sig.bind() 的版本比较一下调用开销：
+from timeit import timeit
+
+def bench(number=10**5):
+    def add(x, y, z=0):
+        return x + y + z
+    bound_add = _bind_typeassert(int, int, z=int)(add)
+    compiled_add = typeassert(int, int, z=int)(add)
+    for label, f in [('bare', add), ('bind', bound_add), ('compiled', compiled_add)]:
+        t = timeit('f(1, 2, z=3)', globals={'f': f}, number=number)
+        print('{:>8}: {:.0f} ns/call'.format(label, t / number * 1e9))
+
+bench()
+# 编译出来的版本只比原函数多了一次函数调用和几次 isinstance() ，比每次 bind() 快了一个数量级。
+# 和上面一样，以 -O 选项运行时装饰器直接返回原函数，类型检查完全没有开销。